@@ -19,9 +19,83 @@ A-B-A-001  B  3  5
 
 import os
 import sys
-import re
+import json
+import itertools
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 import xlwt
-from docx import Document
+from lxml import etree
+
+# 元数据行（A-B-A-001  B  3  5）的合法字符：代码中的大写字母、题型代码
+_CODE_LETTERS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_TYPE_CODES = frozenset('BCD')
+
+# WordprocessingML命名空间，以及取出正文各段落（不含表格、文本框中的段落）的XPath
+_W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+_W_BODY_PARAGRAPHS = etree.XPath('/w:document/w:body/w:p', namespaces={'w': _W_NS})
+
+# 一次取出段落中（含超链接内）各文本段的XPath，与python-docx的Paragraph.text取相同的元素
+_W_RUN_CONTENT = etree.XPath(
+    ' | '.join(run + '/w:' + item
+               for run in ('w:r', 'w:hyperlink/w:r')
+               for item in ('t', 'tab', 'ptab', 'br', 'cr', 'noBreakHyphen')),
+    namespaces={'w': _W_NS})
+
+# 非<w:t>文本段对应的字符：制表符为\t，换行为\n（<w:br>只有换行类型才是\n，分页、分栏为空）
+_W_T = '{%s}t' % _W_NS
+_W_BR = '{%s}br' % _W_NS
+_W_BR_TYPE = '{%s}type' % _W_NS
+_W_TEXT_EQUIVALENTS = {
+    '{%s}tab' % _W_NS: '\t',
+    '{%s}ptab' % _W_NS: '\t',
+    '{%s}cr' % _W_NS: '\n',
+    '{%s}noBreakHyphen' % _W_NS: '-',
+}
+
+# 批量转换时复用同一个XML解析器（每个进程一个），省去逐文件创建解析器的开销
+_XML_PARSER = etree.XMLParser(huge_tree=True, remove_blank_text=True)
+
+# XLS表头
+_HEADERS = (
+    '鉴定点代码', '题目类型代码', '试题(题干)', '选项A', '选项B',
+    '选项C', '选项D', '选项E', '答案', '难度代码', '一致性代码'
+)
+
+# 每道题目是按XLS列顺序排列的字段列表，以下为各字段的下标
+_CODE, _TYPE, _STEM, _ANSWER, _DIFFICULTY, _CONSISTENCY = 0, 1, 2, 8, 9, 10
+_OPTION_INDEX = {'A': 3, 'B': 4, 'C': 5, 'D': 6, 'E': 7}  # 选项字母 -> 下标
+_FIELD_COUNT = len(_HEADERS)
+
+# 解析结果缓存文件后缀，缓存放在docx旁边：A-B-A-001.docx.parsed.json
+_CACHE_SUFFIX = '.parsed.json'
+
+# 解析结果缓存的版本号，iter_paragraph_texts/iter_questions的解析结果有变化时加1，使旧缓存失效
+_CACHE_VERSION = 2
+
+# 写XLS时每写满这么多行，就把已完成的行序列化到临时文件并释放行对象
+_FLUSH_EVERY_ROWS = 1000
+
+
+def _paragraph_text(p):
+    """取出段落文本，制表符、换行等转换为对应字符（与python-docx的Paragraph.text一致）"""
+    parts = []
+    for element in _W_RUN_CONTENT(p):
+        tag = element.tag
+        if tag == _W_T:
+            parts.append(element.text or '')
+        elif tag == _W_BR:
+            if element.get(_W_BR_TYPE, 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        else:
+            parts.append(_W_TEXT_EQUIVALENTS[tag])
+    return ''.join(parts)
+
+
+def _is_code(text):
+    """判断是否为 A-B-A-001 形式的鉴定点代码"""
+    return (len(text) > 6 and text[1] == text[3] == text[5] == '-'
+            and text[0] in _CODE_LETTERS and text[2] in _CODE_LETTERS and text[4] in _CODE_LETTERS
+            and text[6:].isdecimal())
 
 
 class DocxToXlsConverter:
@@ -31,82 +105,179 @@ class DocxToXlsConverter:
         """初始化转换器"""
         pass
 
-    def parse_docx(self, docx_filepath):
+    def iter_paragraph_texts(self, docx_filepath):
         """
-        解析Word文档，提取题目信息
+        逐段读取Word文档的文本
+
+        直接从docx压缩包中读取word/document.xml并用共享的解析器解析，
+        不加载样式、编号、媒体等其余部件
 
         Args:
             docx_filepath: Word文档路径
 
-        Returns:
-            list: 题目列表，每个题目是一个字典
+        Yields:
+            str: 段落文本
+        """
+        with zipfile.ZipFile(docx_filepath) as zf:
+            data = zf.read('word/document.xml')
+        root = etree.fromstring(data, _XML_PARSER)
+        for p in _W_BODY_PARAGRAPHS(root):
+            yield _paragraph_text(p)
+
+    def iter_questions(self, docx_filepath):
+        """
+        解析Word文档，逐题产出题目信息
+
+        Args:
+            docx_filepath: Word文档路径
+
+        Yields:
+            list: 题目，按XLS列顺序排列的字段列表
         """
-        doc = Document(docx_filepath)
-        questions = []
         current_question = None
 
-        for para in doc.paragraphs:
-            text = para.text.strip()
+        for text in self.iter_paragraph_texts(docx_filepath):
+            # 绝大多数行没有前导空白，只在需要时去掉；行尾空白只在取内容时去掉
+            if text[:1].isspace():
+                text = text.lstrip()
 
             if not text:
                 continue
 
-            # 匹配元数据行：A-B-A-001  B  3  5
-            meta_match = re.match(r'^([A-Z]-[A-Z]-[A-Z]-\d+)\s+([BCD])\s+(\d+)\s+(\d+)$', text)
-            if meta_match:
-                # 如果已有题目，保存它
-                if current_question:
-                    questions.append(current_question)
-
-                # 创建新题目
-                current_question = {
-                    '鉴定点代码': meta_match.group(1),
-                    '题型': meta_match.group(2),
-                    '难度': meta_match.group(3),
-                    '一致性': meta_match.group(4),
-                    '题干': '',
-                    '选项A': '',
-                    '选项B': '',
-                    '选项C': '',
-                    '选项D': '',
-                    '选项E': '',
-                    '答案': ''
-                }
+            # 题干：{A}题干内容
+            if text.startswith('{A}'):
+                stem = text[3:].rstrip()
+                if current_question and stem:
+                    current_question[_STEM] = stem
                 continue
 
-            # 匹配题干：{A}题干内容
-            stem_match = re.match(r'^\{A\}(.+)$', text)
-            if stem_match and current_question:
-                current_question['题干'] = stem_match.group(1)
+            # 答案：{B}答案
+            if text.startswith('{B}'):
+                answer = text[3:].rstrip()
+                if current_question and answer:
+                    current_question[_ANSWER] = answer
                 continue
 
-            # 匹配选项：（A）选项内容
-            option_match = re.match(r'^（([A-E])）(.+)$', text)
-            if option_match and current_question:
-                option_letter = option_match.group(1)
-                option_content = option_match.group(2)
-                current_question[f'选项{option_letter}'] = option_content
+            # 选项：（A）选项内容
+            if text.startswith('（'):
+                # 格式固定：第2个字符是选项字母，第3个字符是右括号
+                if current_question and text[2:3] == '）' and text[1] in _OPTION_INDEX:
+                    option = text[3:].rstrip()
+                    if option:
+                        current_question[_OPTION_INDEX[text[1]]] = option
                 continue
 
-            # 匹配答案：{B}答案
-            answer_match = re.match(r'^\{B\}(.+)$', text)
-            if answer_match and current_question:
-                current_question['答案'] = answer_match.group(1)
-                continue
+            # 元数据行：A-B-A-001  B  3  5
+            parts = text.split()
+            if (len(parts) == 4 and parts[1] in _TYPE_CODES and parts[2].isdecimal()
+                    and parts[3].isdecimal() and _is_code(parts[0])):
+                # 如果已有题目，产出它
+                if current_question:
+                    yield current_question
 
-        # 保存最后一个题目
+                # 创建新题目；题型、难度、一致性取值很少，驻留后各题共用同一个字符串对象
+                current_question = [''] * _FIELD_COUNT
+                current_question[_CODE] = parts[0]
+                current_question[_TYPE] = sys.intern(parts[1])
+                current_question[_DIFFICULTY] = sys.intern(parts[2])
+                current_question[_CONSISTENCY] = sys.intern(parts[3])
+
+        # 产出最后一个题目
         if current_question:
-            questions.append(current_question)
+            yield current_question
+
+    def parse_docx(self, docx_filepath):
+        """
+        解析Word文档，提取题目信息
+
+        Args:
+            docx_filepath: Word文档路径
+
+        Returns:
+            list: 题目列表，每个题目是按XLS列顺序排列的字段列表
+        """
+        return list(self.iter_questions(docx_filepath))
+
+    def _read_cache(self, cache_filepath, key):
+        """
+        读取解析结果缓存
 
+        缓存是JSON Lines文本：第一行为（缓存版本, 文档修改时间, 大小），之后每行一道题目。
+        只按数据解析，内容不合法的缓存文件只会被当作缓存未命中
+
+        Args:
+            cache_filepath: 缓存文件路径
+            key: 当前文档的缓存键
+
+        Returns:
+            list: 题目列表，缓存不存在、已过期或不合法时返回None
+        """
+        try:
+            with open(cache_filepath, encoding='utf-8') as f:
+                if json.loads(f.readline()) != list(key):
+                    return None
+                questions = [json.loads(line) for line in f]
+        except (OSError, ValueError, RecursionError):
+            return None
+
+        for question in questions:
+            if (not isinstance(question, list) or len(question) != _FIELD_COUNT
+                    or not all(isinstance(value, str) for value in question)):
+                return None
         return questions
 
+    def load_questions(self, docx_filepath):
+        """
+        逐题读取Word文档中的题目，文档未修改时直接读取上次的解析结果
+
+        解析时边产出边把题目追加写入临时缓存文件，全部写完后才替换旧缓存
+
+        Args:
+            docx_filepath: Word文档路径
+
+        Yields:
+            list: 题目，格式同iter_questions
+        """
+        stat = os.stat(docx_filepath)
+        key = (_CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+        cache_filepath = docx_filepath + _CACHE_SUFFIX
+
+        questions = self._read_cache(cache_filepath, key)
+        if questions is not None:
+            yield from questions
+            return
+
+        tmp_filepath = cache_filepath + '.tmp'
+        try:
+            f = open(tmp_filepath, 'w', encoding='utf-8')
+        except OSError:
+            # 无法写缓存时只解析，不影响转换
+            yield from self.iter_questions(docx_filepath)
+            return
+
+        completed = False
+        try:
+            with f:
+                f.write(json.dumps(key) + '\n')
+                for question in self.iter_questions(docx_filepath):
+                    f.write(json.dumps(question, ensure_ascii=False) + '\n')
+                    yield question
+            os.replace(tmp_filepath, cache_filepath)
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+
     def save_to_xls(self, questions, xls_filepath):
         """
         将题目保存为XLS文件
 
         Args:
-            questions: 题目列表
+            questions: 题目的可迭代对象，边迭代边写入
             xls_filepath: XLS文件路径
+
+        Returns:
+            int: 写入的题目数量
         """
         # 创建工作簿
         wb = xlwt.Workbook(encoding='utf-8')
@@ -119,32 +290,27 @@ class DocxToXlsConverter:
         font.height = 220  # 11号字体
         style.font = font
 
-        # 写入表头
-        headers = [
-            '鉴定点代码', '题目类型代码', '试题(题干)', '选项A', '选项B',
-            '选项C', '选项D', '选项E', '答案', '难度代码', '一致性代码'
-        ]
-
-        for col_idx, header in enumerate(headers):
+        # 写入表头，并把宋体设为各列的默认样式
+        for col_idx, header in enumerate(_HEADERS):
             ws.write(0, col_idx, header, style)
+            ws.col(col_idx).set_style(style)
 
-        # 写入题目数据
+        # 写入题目数据（每行只取一次Row对象，直接写入单元格记录）
+        get_row = ws.row  # 绑定为局部变量，省去循环内的属性查找
+        row_idx = 0
         for row_idx, question in enumerate(questions, start=1):
-            ws.write(row_idx, 0, question['鉴定点代码'], style)
-            ws.write(row_idx, 1, question['题型'], style)
-            ws.write(row_idx, 2, question['题干'], style)
-            ws.write(row_idx, 3, question['选项A'], style)
-            ws.write(row_idx, 4, question['选项B'], style)
-            ws.write(row_idx, 5, question['选项C'], style)
-            ws.write(row_idx, 6, question['选项D'], style)
-            ws.write(row_idx, 7, question['选项E'], style)
-            ws.write(row_idx, 8, question['答案'], style)
-            ws.write(row_idx, 9, question['难度'], style)
-            ws.write(row_idx, 10, question['一致性'], style)
+            write = get_row(row_idx).write
+            for col_idx, value in enumerate(question):
+                # 空单元格（如单选、判断题的空选项）由列默认样式覆盖，不单独写入
+                if value:
+                    write(col_idx, value, style)
+
+            if row_idx % _FLUSH_EVERY_ROWS == 0:
+                ws.flush_row_data()
 
         # 保存文件
         wb.save(xls_filepath)
-        print(f"[OK] 已保存到: {xls_filepath}")
+        return row_idx
 
     def convert_file(self, docx_filepath, xls_filepath=None):
         """
@@ -160,25 +326,39 @@ class DocxToXlsConverter:
 
         print(f"正在处理: {docx_filepath}")
 
-        # 解析Word文档
-        questions = self.parse_docx(docx_filepath)
+        # 边解析边写入（文档未修改时从缓存读取），先取第一题确认文档中有题目
+        questions = self.load_questions(docx_filepath)
+        first_question = next(questions, None)
 
-        if not questions:
-            print(f"⚠ 警告: 未找到任何题目")
+        if first_question is None:
+            print(f"⚠ 警告: 未找到任何题目 - {docx_filepath}")
             return
 
-        print(f"[OK] 解析到 {len(questions)} 道题目")
-
         # 确定输出文件路径
         if xls_filepath is None:
             # 从 A-B-A-001.docx 转换为 考题A-B-A-001.xls
-            basename = os.path.basename(docx_filepath)
-            name_without_ext = os.path.splitext(basename)[0]
-            xls_filename = f"考题{name_without_ext}.xls"
-            xls_filepath = os.path.join(os.path.dirname(docx_filepath), xls_filename)
+            dirname, basename = os.path.split(docx_filepath)
+            stem = basename[:-5] if basename.endswith('.docx') else os.path.splitext(basename)[0]
+            xls_filepath = os.path.join(dirname, '考题' + stem + '.xls')
 
-        # 保存为XLS
-        self.save_to_xls(questions, xls_filepath)
+        # 保存为XLS（并行转换时各文件的输出会交错，提示中带上文档路径）
+        count = self.save_to_xls(itertools.chain((first_question,), questions), xls_filepath)
+        print(f"[OK] {docx_filepath}: 已保存 {count} 道题目到: {xls_filepath}")
+
+    def _convert_file_in_worker(self, docx_filepath):
+        """
+        在子进程中转换单个文件
+
+        出错时改为抛出带文档路径的RuntimeError：并行转换时无法从输出顺序判断出错的文档，
+        而且lxml的部分异常无法传回主进程
+
+        Args:
+            docx_filepath: Word文档路径
+        """
+        try:
+            self.convert_file(docx_filepath)
+        except Exception as e:
+            raise RuntimeError(f"转换失败 - {docx_filepath}: {type(e).__name__}: {e}") from None
 
     def convert_directory(self, directory):
         """
@@ -192,10 +372,11 @@ class DocxToXlsConverter:
             return
 
         # 查找所有docx文件（排除临时文件）
-        docx_files = []
-        for filename in os.listdir(directory):
-            if filename.endswith('.docx') and not filename.startswith('~$'):
-                docx_files.append(os.path.join(directory, filename))
+        with os.scandir(directory) as it:
+            docx_files = sorted(
+                entry.path for entry in it
+                if entry.is_file() and entry.name.endswith('.docx') and not entry.name.startswith('~$')
+            )
 
         if not docx_files:
             print(f"⚠ 警告: 目录中没有找到docx文件")
@@ -204,10 +385,10 @@ class DocxToXlsConverter:
         print(f"找到 {len(docx_files)} 个Word文档")
         print("="*60)
 
-        # 转换每个文件
-        for docx_file in sorted(docx_files):
-            self.convert_file(docx_file)
-            print()
+        # 各文件互不依赖，用多进程并行转换
+        max_workers = min(len(docx_files), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self._convert_file_in_worker, docx_files))
 
         print("="*60)
         print(f"[OK] 完成! 共处理 {len(docx_files)} 个文件")
@@ -8,17 +8,21 @@ import sys
 import io
 import re
 import json
+import asyncio
+import contextvars
+import functools
+import hashlib
+import itertools
 import logging
+import logging.handlers
+import sqlite3
+import tempfile
+import time
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 import openpyxl
-from openpyxl import Workbook
-import xlwt
-from docx import Document
-from docx.shared import Pt, RGBColor
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from openai import OpenAI
 from dotenv import load_dotenv
+# xlwt、python-docx、openai 导入较慢，在用到的方法中再导入
 
 # Windows下设置UTF-8编码
 if sys.platform == 'win32':
@@ -27,6 +31,82 @@ if sys.platform == 'win32':
 # 加载环境变量
 load_dotenv()
 
+# 脚本所在目录，以及其中的教材目录（resources）和考题输出目录（questions）
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+_RESOURCES_DIR = os.path.join(_SCRIPT_DIR, "resources")
+_QUESTIONS_DIR = os.path.join(_SCRIPT_DIR, "questions")
+
+# LLM响应缓存文件（删除即可清空缓存）
+LLM_CACHE_PATH = os.path.join(_SCRIPT_DIR, ".llm_cache.sqlite3")
+
+# API限流配置的默认值：每分钟请求数、每分钟token数（可在.env中用DASHSCOPE_RPM、DASHSCOPE_TPM按账号额度调整）
+_DEFAULT_RPM = 600
+_DEFAULT_TPM = 1000000
+
+# 日志缓冲的记录条数，缓冲满或出现WARNING及以上级别的日志时写出
+_LOG_BUFFER_CAPACITY = 256
+
+# 当前日志所属的xlsx文件、鉴定点（多个文件、鉴定点并发处理时用于区分日志来源）
+_log_context = contextvars.ContextVar("log_context", default=())
+
+# 输出目录中记录已完成鉴定点的进度文件
+_PROGRESS_FILENAME = ".progress.json"
+
+# 题目XLS文件的表头
+_XLS_HEADERS = ("鉴定点代码", "题目类型代码", "试题(题干)",
+                "选项A", "选项B", "选项C", "选项D", "选项E",
+                "答案", "难度代码", "一致性代码")
+
+# 同时处理的鉴定点数量上限的默认值（可在.env中用DASHSCOPE_CONCURRENCY调整）
+_DEFAULT_CONCURRENCY = 10
+
+# 估算请求token数时为模型输出预留的token数
+_ESTIMATED_OUTPUT_TOKENS = 2000
+
+# 触发API限流后的最大重试次数
+_RATE_LIMIT_RETRIES = 5
+
+# 前两行中出现这些关键字时，判定为带表头的格式2
+_FORMAT2_KEYWORDS = ('题目序号', '鉴定点', '资料')
+
+# 编号列中出现这些关键字的行是表头，不是鉴定点
+_HEADER_KEYWORDS = ('题目序号', '鉴定点', '序号')
+
+# 将编号中的中文破折号替换为英文连字符
+_DASH_TABLE = str.maketrans({'—': '-', '－': '-'})
+
+# 题目规则检查：不需要AI就能判断的违规表述
+_SECTION_RE = re.compile(r'\d+\.\d+\.\d+条?|\d+\.\d+条|第[一二三四五六七八九十\d]+章')   # 章节编号
+# 图表、图纸引用：只匹配出题要求中禁止的说法（"如图"、"图X所示"、"图X.X"、"见图"、"图示结构"等），
+# 不匹配"按图示尺寸加工"这类普通表述
+_FIGURE_RE = re.compile(r'如图|见附?图|图[一二三四五六七八九十\d]+(?:\.\d+)*(?:所示|中)|图\d+\.\d+'
+                        r'|根据图纸|参考示意图|下图中|图中的|图示结构')
+_EXAMPLE_RE = re.compile(r'如（\s*）')  # "例如（   ）"、"如（   ）"
+_ETC_RE = re.compile(r'（\s*）等')
+_BLANK_RE = re.compile(r'（\s*）')
+_TAIL_BLANK_RE = re.compile(r'（\s*）。?$')
+_META_WORDS = ('鉴定点', '知识点')
+
+
+class _LogContextFilter(logging.Filter):
+    """在记录日志时取出当前的xlsx文件、鉴定点（缓冲的日志稍后才格式化，届时已不在原来的上下文中）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.log_context = _log_context.get()
+        return True
+
+
+class _LogContextFormatter(logging.Formatter):
+    """在日志内容前加上 [文件 鉴定点] 前缀（放在开头的空行之后）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        labels = getattr(record, "log_context", ())
+        if not labels:
+            return message
+        body = message.lstrip("\n")
+        return f"{message[:len(message) - len(body)]}[{' '.join(labels)}] {body}"
+
 
 def setup_logging(log_dir: str = "logs") -> str:
     """
@@ -39,8 +119,7 @@ def setup_logging(log_dir: str = "logs") -> str:
         日志文件路径
     """
     # 创建日志目录
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    os.makedirs(log_dir, exist_ok=True)
 
     # 生成日志文件名（带时间戳）
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -54,250 +133,304 @@ def setup_logging(log_dir: str = "logs") -> str:
     # 清除已有的handlers
     logger.handlers.clear()
 
-    # 创建文件handler（禁用缓冲）
+    # 创建文件handler
     file_handler = logging.FileHandler(log_filepath, encoding='utf-8', mode='w')
     file_handler.setLevel(logging.INFO)
 
-    # 创建控制台handler（禁用缓冲）
+    # 创建控制台handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.flush = sys.stdout.flush  # 强制刷新
 
-    # 创建formatter
-    formatter = logging.Formatter('%(message)s')
+    # 创建formatter（并发处理时每行日志带上所属的文件、鉴定点）
+    formatter = _LogContextFormatter('%(message)s')
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
-    # 添加handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # 日志文件缓冲写入；控制台在终端中保持实时输出，重定向到文件或管道时同样缓冲
+    handlers = [logging.handlers.MemoryHandler(
+        _LOG_BUFFER_CAPACITY, flushLevel=logging.WARNING, target=file_handler)]
+    if sys.stdout.isatty():
+        handlers.append(console_handler)
+    else:
+        handlers.append(logging.handlers.MemoryHandler(
+            _LOG_BUFFER_CAPACITY, flushLevel=logging.WARNING, target=console_handler))
+    for handler in handlers:
+        handler.addFilter(_LogContextFilter())
+        logger.addHandler(handler)
 
     return log_filepath
 
 
-class QuestionGenerator:
-    """考题生成器"""
+def _flush_logs():
+    """立即写出所有日志handler中缓冲的内容"""
+    for handler in logging.getLogger().handlers:
+        handler.flush()
 
-    # 不同等级的出题数量要求（注意：等级仅决定题目数量，不影响题目难度）
-    LEVEL_REQUIREMENTS = {
-        "一级": {"单选": 3, "判断": 2, "多选": 2},  # 共7题
-        "二级": {"单选": 3, "判断": 2, "多选": 2},  # 共7题
-        "三级": {"单选": 3, "判断": 2, "多选": 2},  # 共7题
-        "四级": {"单选": 4, "判断": 2, "多选": 0},  # 共6题
-        "五级": {"单选": 4, "判断": 2, "多选": 0},  # 共6题
-    }
 
-    def __init__(self):
-        """初始化生成器"""
-        api_key = os.getenv("DASHSCOPE_API_KEY")
-        if not api_key:
-            raise ValueError("请在.env文件中设置DASHSCOPE_API_KEY")
+def _progress(message: str, *args):
+    """输出进度信息（参数同logging.info）并立即刷新所有日志handler（用于耗时的AI调用之前）"""
+    logging.info(message, *args)
+    _flush_logs()
 
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-        )
 
-    def extract_level_from_filename(self, filename: str) -> Optional[str]:
-        """
-        从文件名中提取等级信息
+class ResponseCache:
+    """LLM响应缓存（SQLite），以请求内容的SHA256为键"""
 
+    def __init__(self, db_path: str):
+        """
         Args:
-            filename: 文件名,例如 "三级3001-3010.xlsx"
-
-        Returns:
-            等级字符串,如 "三级",如果未找到则返回None
+            db_path: 缓存数据库文件路径
         """
-        # 匹配 "一级", "二级", "三级", "四级", "五级"
-        pattern = r'(一级|二级|三级|四级|五级)'
-        match = re.search(pattern, filename)
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL)"
+        )
+        self._conn.commit()
 
-        if match:
-            return match.group(1)
-        else:
-            return None
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """根据模型、提示词等请求内容生成缓存键"""
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
 
-    def detect_file_format(self, filepath: str) -> str:
-        """
-        检测xlsx文件的格式类型
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存的响应，不存在时返回None"""
+        row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
 
-        Args:
-            filepath: xlsx文件路径
+    def set(self, key: str, response: str):
+        """写入响应"""
+        self._conn.execute("INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)", (key, response))
+        self._conn.commit()
 
-        Returns:
-            格式类型: "format1"、"format2" 或 "format3"
-        """
-        wb = openpyxl.load_workbook(filepath)
-        ws = wb.active
 
-        # 读取前3行判断格式
-        rows = list(ws.iter_rows(min_row=1, max_row=3, values_only=True))
+def _positive_int_env(name: str, default: int) -> int:
+    """
+    读取取值为正整数的环境变量
 
-        # 检查第1行是否包含表头关键字
-        if len(rows) >= 1:
-            row1 = rows[0]
-            row1_str = ' '.join([str(cell) if cell else '' for cell in row1])
-            
-            # 检查是否为format3（四级文件格式）
-            # 特征：第1行包含"鉴定范围"且第6列为"题目序号"
-            if '鉴定范围' in row1_str and len(row1) > 5:
-                col6_str = str(row1[5]) if row1[5] else ''
-                if '题目序号' in col6_str:
-                    wb.close()
-                    return "format3"
-            
-            # 如果第1行包含"题目序号"、"鉴定点"、"资料"等关键字，判定为格式2
-            if any(keyword in row1_str for keyword in ['题目序号', '鉴定点', '资料']):
-                wb.close()
-                return "format2"
+    Args:
+        name: 环境变量名
+        default: 未设置时的默认值
 
-        # 检查第2行是否包含表头关键字（format2的另一种情况）
-        if len(rows) >= 2:
-            row2 = rows[1]
-            row2_str = ' '.join([str(cell) if cell else '' for cell in row2])
-            # 如果第2行包含"题目序号"、"鉴定点"、"资料"等关键字，判定为格式2
-            if any(keyword in row2_str for keyword in ['题目序号', '鉴定点', '资料']):
-                wb.close()
-                return "format2"
+    Returns:
+        环境变量的值
 
-        # 检查第1行第1列是否为数字（序号）- format1的特征
-        if len(rows) >= 1 and rows[0][0]:
-            first_cell = str(rows[0][0])
-            if first_cell.isdigit():
-                wb.close()
-                return "format1"
+    Raises:
+        ValueError: 取值不是大于0的整数
+    """
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise ValueError(f"{name}必须是大于0的整数（当前为{value!r}）")
+    return number
 
-        wb.close()
-        return "format1"  # 默认格式1
 
-    def read_knowledge_points(self, filepath: str) -> List[Dict[str, str]]:
-        """
-        读取xlsx文件中的鉴定点信息（自动检测格式）
+def _cell_str(value) -> str:
+    """单元格值转为去掉首尾空白的字符串，空单元格返回空字符串"""
+    return str(value).strip() if value else ""
 
-        Args:
-            filepath: xlsx文件路径
 
-        Returns:
-            鉴定点列表,每个元素包含 {"编号": "...", "名称": "...", "内容": "..."}
-        """
-        file_format = self.detect_file_format(filepath)
-        logging.info(f"  检测到文件格式: {file_format}")
+def _load_progress(output_dir: str) -> Optional[dict]:
+    """
+    读取输出目录的进度文件
 
-        wb = openpyxl.load_workbook(filepath)
-        ws = wb.active
+    进度文件的修改时间在写入后被设为与目录相同，目录中增删文件（如手动删除
+    某个题目文件）会改变目录的修改时间，此时进度文件视为过期
 
-        knowledge_points = []
+    Args:
+        output_dir: 输出目录
 
-        if file_format == "format1":
-            # 格式1: 第1列=序号, 第2列=编号, 第3列=名称, 第4列=内容
-            for row in ws.iter_rows(min_row=1, values_only=True):
-                if row[0] is None:  # 跳过空行
-                    continue
+    Returns:
+        进度字典，"done"为已完成的鉴定点编号集合；"source"（如有）记录上次解析的
+        xlsx文件的修改时间、大小和全部鉴定点编号。进度文件不存在或已过期时返回None
+    """
+    progress_filepath = os.path.join(output_dir, _PROGRESS_FILENAME)
+    try:
+        if os.stat(progress_filepath).st_mtime_ns != os.stat(output_dir).st_mtime_ns:
+            return None
+        with open(progress_filepath, encoding='utf-8') as f:
+            progress = json.load(f)
+        progress["done"] = set(progress["done"])
+        return progress
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
 
-                # 获取编号并标准化（将中文破折号替换为英文连字符）
-                code = str(row[1]) if row[1] else ""
-                code = code.replace('—', '-').replace('－', '-')
-
-                point = {
-                    "序号": str(row[0]) if row[0] else "",
-                    "编号": code,  # 使用标准化后的编号
-                    "名称": str(row[2]) if row[2] else "",
-                    "内容": str(row[3]) if row[3] else "",
-                }
-                knowledge_points.append(point)
-
-        elif file_format == "format2":
-            # 格式2: 跳过第1行（表头）, 第1列=编号, 第2列=名称, 第3列=内容（索引2）
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                # 跳过空行（第1列为空）
-                if row[0] is None or str(row[0]).strip() == "":
-                    continue
 
-                # 获取编号并标准化（将中文破折号替换为英文连字符）
-                code = str(row[0]).strip()
-                # 替换中文破折号为英文连字符
-                code = code.replace('—', '-').replace('－', '-')
-                
-                # 检查是否为有效的鉴定点编号（格式如 A-B-A-001）
-                if not code or len(code) < 5:
-                    continue
-                
-                # 跳过表头行（如果编号包含"题目序号"等关键字）
-                if any(keyword in code for keyword in ['题目序号', '鉴定点', '序号']):
-                    continue
+def _save_progress(output_dir: str, progress: dict):
+    """
+    写入输出目录的进度文件（先写临时文件再替换，中途中断不会留下损坏的进度文件）
 
-                point = {
-                    "序号": code,  # 第1列就是序号/编号
-                    "编号": code,  # 使用标准化后的编号
-                    "名称": str(row[1]).strip() if len(row) > 1 and row[1] else "",
-                    "内容": str(row[2]).strip() if len(row) > 2 and row[2] else "",  # 第3列是内容
-                }
-                knowledge_points.append(point)
-
-        else:  # format3
-            # 格式3: 四级文件格式，跳过第1行（表头）
-            # 第6列（索引5）=编号, 第7列（索引6）=名称, 第9列（索引8）=内容
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                # 跳过空行（第6列为空）
-                if len(row) <= 5 or row[5] is None or str(row[5]).strip() == "":
-                    continue
+    Args:
+        output_dir: 输出目录
+        progress: 进度字典，格式同_load_progress的返回值
+    """
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=output_dir,
+                                     suffix='.tmp', delete=False) as f:
+        json.dump({**progress, "done": sorted(progress["done"])}, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    progress_filepath = os.path.join(output_dir, _PROGRESS_FILENAME)
+    os.replace(f.name, progress_filepath)
 
-                # 获取编号并标准化（将中文破折号替换为英文连字符）
-                code = str(row[5]).strip()
-                # 替换中文破折号为英文连字符
-                code = code.replace('—', '-').replace('－', '-')
-                
-                # 检查是否为有效的鉴定点编号（格式如 B-D-A-001）
-                if not code or len(code) < 5 or '-' not in code:
-                    continue
-                
-                # 跳过表头行
-                if any(keyword in code for keyword in ['题目序号', '鉴定点', '序号']):
-                    continue
+    # 替换文件会更新目录的修改时间，把进度文件的修改时间设为与目录一致
+    dir_mtime_ns = os.stat(output_dir).st_mtime_ns
+    os.utime(progress_filepath, ns=(dir_mtime_ns, dir_mtime_ns))
 
-                point = {
-                    "序号": code,  # 使用编号作为序号
-                    "编号": code,  # 使用标准化后的编号
-                    "名称": str(row[6]).strip() if len(row) > 6 and row[6] else "",
-                    "内容": str(row[8]).strip() if len(row) > 8 and row[8] else "",
-                }
-                knowledge_points.append(point)
 
-        wb.close()
-        return knowledge_points
+@functools.lru_cache(maxsize=256)
+def _resolve_input_path(input_path: str, resources_index: frozenset) -> str:
+    """
+    解析输入文件路径（结果按文件名和resources目录索引缓存，同一文件重复解析时不再检查磁盘）
+
+    Args:
+        input_path: 输入路径或文件名
+        resources_index: resources目录的文件名索引
+
+    Returns:
+        完整的文件路径
+    """
+    # 如果是绝对路径或相对路径（包含路径分隔符），直接使用
+    if os.path.sep in input_path or os.path.isabs(input_path):
+        return input_path
 
+    # 如果只是文件名，在resources目录中查找（先查启动时的目录索引，找不到再检查磁盘）
+    resources_path = os.path.join(_RESOURCES_DIR, input_path)
 
-    def generate_all_questions_at_once(self, knowledge_point: Dict[str, str],
-                                      level: str) -> Optional[List[Dict]]:
+    if input_path in resources_index or os.path.exists(resources_path):
+        return resources_path
+
+    # 如果resources目录中没有，返回原路径
+    return input_path
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数（中文约每2个字符1个token）"""
+    return len(text) // 2
+
+
+class RateLimiter:
+    """按每分钟请求数（RPM）和每分钟token数（TPM）限流的令牌桶，请求前先等待额度"""
+
+    # 触发服务端限流后速率上限的下调比例，以及之后未再触发限流时的逐步恢复比例
+    DECAY_FACTOR = 0.8
+    RECOVERY_FACTOR = 1.25
+    # 两次下调、两次恢复之间的最短间隔（秒）：同一波并发请求同时被限流只下调一次
+    ADJUST_INTERVAL = 60
+
+    def __init__(self, rpm: int, tpm: int):
         """
-        一次性生成一个鉴定点的所有题目（避免重复）
+        Args:
+            rpm: 每分钟请求数上限
+            tpm: 每分钟token数上限
+        """
+        if rpm <= 0 or tpm <= 0:
+            raise ValueError(f"RPM和TPM必须大于0（当前RPM={rpm}，TPM={tpm}）")
+        self.max_rpm = self.rpm = float(rpm)
+        self.max_tpm = self.tpm = float(tpm)
+        self._available_requests = self.rpm
+        self._available_tokens = self.tpm
+        self._last_refill = time.monotonic()
+        self._last_decay = self._last_adjust = float('-inf')
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        """按距上次补充经过的时间补充额度"""
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+
+        # 下调后一段时间内没有再触发限流，逐步恢复到配置的上限
+        if (self.rpm < self.max_rpm or self.tpm < self.max_tpm) and now - self._last_adjust >= self.ADJUST_INTERVAL:
+            self.rpm = min(self.max_rpm, self.rpm * self.RECOVERY_FACTOR)
+            self.tpm = min(self.max_tpm, self.tpm * self.RECOVERY_FACTOR)
+            self._last_adjust = now
+
+        self._available_requests = min(self.rpm, self._available_requests + elapsed * self.rpm / 60)
+        self._available_tokens = min(self.tpm, self._available_tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int):
+        """
+        等待直到有足够额度发送一个请求
 
         Args:
-            knowledge_point: 鉴定点信息
-            level: 等级（仅用于确定题目数量，不影响难度）
+            tokens: 该请求预计消耗的token数
+        """
+        # 单个请求超过整个桶的容量时按桶容量计，否则永远等不到
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._available_requests >= 1 and self._available_tokens >= tokens:
+                    self._available_requests -= 1
+                    self._available_tokens -= tokens
+                    return
+                wait = max((1 - self._available_requests) * 60 / self.rpm,
+                           (tokens - self._available_tokens) * 60 / self.tpm)
+                await asyncio.sleep(wait)
+
+    def reset_lock(self):
+        """换用新的事件循环时重建锁（已用过的asyncio.Lock不能在其他事件循环中使用），速率状态保留"""
+        self._lock = asyncio.Lock()
+
+    def decay(self) -> bool:
+        """
+        触发服务端限流后下调速率上限（距上次下调不足ADJUST_INTERVAL时不再下调）
 
         Returns:
-            题目列表，如果生成失败返回None
+            是否下调了速率上限
         """
-        # 检查知识点内容是否为空
-        content = knowledge_point.get('内容', '').strip()
-        if not content:
-            logging.error(f"  ❌ 错误：鉴定点内容为空，无法生成题目")
-            logging.error(f"  鉴定点编号: {knowledge_point.get('编号', '未知')}")
-            logging.error(f"  鉴定点名称: {knowledge_point.get('名称', '未知')}")
-            sys.stdout.flush()
-            return None
-        
-        requirements = self.LEVEL_REQUIREMENTS[level]
+        now = time.monotonic()
+        if now - self._last_decay < self.ADJUST_INTERVAL:
+            return False
+        self._last_decay = self._last_adjust = now
+        self.rpm = max(1.0, self.rpm * self.DECAY_FACTOR)
+        self.tpm = max(1.0, self.tpm * self.DECAY_FACTOR)
+        self._available_requests = min(self._available_requests, self.rpm)
+        self._available_tokens = min(self._available_tokens, self.tpm)
+        return True
 
-        # 构建prompt，一次性生成所有题目
-        prompt = f"""
-你是一个专业的考试命题专家。请根据以下知识点内容，一次性生成该鉴定点的全部考题。
 
-【知识点信息】
-鉴定点编号: {knowledge_point['编号']}
-鉴定点名称: {knowledge_point['名称']}
-知识点内容: {knowledge_point['内容']}
+class QuestionGenerator:
+    """考题生成器"""
+
+    # 不同等级的出题数量要求（注意：等级仅决定题目数量，不影响题目难度）
+    LEVEL_REQUIREMENTS = {
+        "一级": {"单选": 3, "判断": 2, "多选": 2},  # 共7题
+        "二级": {"单选": 3, "判断": 2, "多选": 2},  # 共7题
+        "三级": {"单选": 3, "判断": 2, "多选": 2},  # 共7题
+        "四级": {"单选": 4, "判断": 2, "多选": 0},  # 共6题
+        "五级": {"单选": 4, "判断": 2, "多选": 0},  # 共6题
+    }
+
+    # 文件名中的等级，如 "三级3001-3010.xlsx" 中的 "三级"（只匹配LEVEL_REQUIREMENTS中的等级）
+    _LEVEL_RE = re.compile("|".join(LEVEL_REQUIREMENTS))
+
+    # 使用的模型
+    MODEL = "qwen3-max"
+
+    # 第一轮用不同温度同时生成多份候选题目，任一份达到优秀即可直接采用
+    SPECULATIVE_TEMPERATURES = (0.3, 0.7, 1.0)
+
+    # 评估结果的优劣排序，用于在候选题目中选出最好的一份继续优化
+    OVERALL_RANK = {"优秀": 0, "良好": 1}
+
+    # 题目类型 -> 输出文件中的题目类型代码
+    TYPE_CODE_MAP = {"单选": "B", "判断": "C", "多选": "D"}
+
+    # 批量生成时单个请求（知识点内容+预计输出）的token预算，据此确定每批的鉴定点数量
+    BATCH_TOKEN_BUDGET = 8000
+
+    # 每道题目预计输出的token数
+    TOKENS_PER_QUESTION = 150
+
+    # 系统提示词：出题、评估、修正的固定规则。所有调用完全相同，
+    # 放在消息开头可以命中服务端的前缀缓存，每次只需计算知识点等可变内容
+    SYSTEM_RULES = """你是一个专业的考试命题专家。请严格按照要求生成考题，确保题目质量高、没有重复，以JSON格式返回。
 
 【特别注意】
 ⚠️ 知识点内容中可能包含规范书名和章节编号（如"《混凝土结构设计规范》9.2.4条"），这些仅是**参考来源**：
@@ -406,11 +539,6 @@ class QuestionGenerator:
    - 既有对宏观知识点的考查，也有对微观知识点的考查
    - 题目应全面覆盖知识点的理论和实践两个维度
 
-【题目数量】
-- 单选题：{requirements['单选']}道（每题4个选项，有且只有一个正确答案）
-- 判断题：{requirements['判断']}道（答案为"正确"或"错误"）
-- 多选题：{requirements['多选']}道（每题5个选项，有两个或以上正确答案）
-
 【单选题要求】
 - 题干中要有且只有一个括号"（   ）"用于填空
 - ⚠️ 括号位置要有多样性：在同一鉴定点的所有单选题和多选题中，括号不能都出现在题干尾部
@@ -443,9 +571,9 @@ class QuestionGenerator:
 
 【输出格式】
 请以JSON格式输出，包含一个"题目列表"数组，每个题目包含以下字段：
-{{
+{
     "题目列表": [
-        {{
+        {
             "题目类型": "单选",
             "题干": "题目内容（   ）。",
             "选项A": "选项A内容",
@@ -453,13 +581,13 @@ class QuestionGenerator:
             "选项C": "选项C内容",
             "选项D": "选项D内容",
             "答案": "B"
-        }},
-        {{
+        },
+        {
             "题目类型": "判断",
             "题干": "题目陈述内容。",
             "答案": "正确"
-        }},
-        {{
+        },
+        {
             "题目类型": "多选",
             "题干": "题目内容（   ）。",
             "选项A": "选项A内容",
@@ -468,9 +596,9 @@ class QuestionGenerator:
             "选项D": "选项D内容",
             "选项E": "选项E内容",
             "答案": "ABC"
-        }}
+        }
     ]
-}}
+}
 
 注意：
 1. 确保题目之间没有重复，同一题型不能考查同一个知识点，但不同题型可以考查同一个知识点。
@@ -478,90 +606,7 @@ class QuestionGenerator:
 3. 严格按照上述JSON格式输出
 """
 
-        try:
-            logging.info(f"  正在调用AI生成题目...")
-            sys.stdout.flush()  # 立即刷新输出
-
-            completion = self.client.chat.completions.create(
-                model="qwen3-max",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的考试命题专家。请严格按照要求生成考题，确保题目质量高、没有重复，以JSON格式返回。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                response_format={"type": "json_object"}
-            )
-
-            logging.info(f"  AI响应完成，正在解析结果...")
-            sys.stdout.flush()  # 立即刷新输出
-
-            json_string = completion.choices[0].message.content
-            
-            # 记录原始响应（用于调试）
-            logging.debug(f"  AI原始响应: {json_string[:500]}...")
-            
-            response_data = json.loads(json_string)
-
-            # 提取题目列表
-            questions = response_data.get("题目列表", [])
-            
-            # 检查是否成功生成题目
-            if not questions:
-                logging.warning(f"  ⚠️  AI返回了空的题目列表")
-                logging.info(f"  完整响应: {json_string}")
-                return None
-
-            # 为每个题目添加鉴定点编号
-            for q in questions:
-                q["鉴定点编号"] = knowledge_point["编号"]
-
-            return questions
-
-        except json.JSONDecodeError as e:
-            logging.error(f"  ❌ JSON解析失败: {e}")
-            logging.error(f"  AI响应内容: {json_string[:1000] if 'json_string' in locals() else '未获取到响应'}")
-            sys.stdout.flush()
-            return None
-        except KeyError as e:
-            logging.error(f"  ❌ 响应格式错误，缺少必要字段: {e}")
-            logging.error(f"  响应内容: {response_data if 'response_data' in locals() else '未解析'}")
-            sys.stdout.flush()
-            return None
-        except Exception as e:
-            logging.error(f"  ❌ 生成题目时出错: {type(e).__name__}: {e}")
-            sys.stdout.flush()
-            return None
-
-    def evaluate_questions(self, knowledge_point: Dict[str, str],
-                          questions: List[Dict]) -> Dict:
-        """
-        评估生成的题目质量
-
-        Args:
-            knowledge_point: 鉴定点信息
-            questions: 生成的题目列表
-
-        Returns:
-            评估结果，包含问题和建议
-        """
-        # 构建评估prompt
-        questions_text = json.dumps(questions, ensure_ascii=False, indent=2)
-
-        prompt = f"""
-你是一个专业的考试质量评估专家。请对以下生成的考题进行全面评估。
-
-【知识点信息】
-鉴定点编号: {knowledge_point['编号']}
-鉴定点名称: {knowledge_point['名称']}
-知识点内容: {knowledge_point['内容']}
-
-【生成的题目】
-{questions_text}
+    EVALUATION_RULES = """你是一个专业的考试质量评估专家。请客观、严格地评估题目质量，以JSON格式返回评估结果。
 
 【评估维度】
 请从以下维度评估题目质量：
@@ -672,24 +717,24 @@ class QuestionGenerator:
 
 【输出格式】
 请以JSON格式输出评估结果：
-{{
+{
     "总体评价": "优秀/良好/需要改进",
     "是否通过": true/false,
     "问题列表": [
-        {{
+        {
             "题目序号": 1,
             "问题类型": "重复性/核心知识点/知识覆盖度/选项准确度/格式规范/语言表达",
             "问题描述": "具体问题说明",
             "严重程度": "严重/一般/轻微"
-        }}
+        }
     ],
     "修改建议": [
-        {{
+        {
             "题目序号": 1,
             "建议内容": "具体的修改建议"
-        }}
+        }
     ]
-}}
+}
 
 注意：
 1. 如果没有问题，问题列表为空数组，is_passed为true
@@ -697,30 +742,634 @@ class QuestionGenerator:
 3. 有严重问题或多个一般问题时，is_passed应为false
 """
 
-        try:
-            logging.info(f"  正在调用AI评估题目...")
-            sys.stdout.flush()  # 立即刷新输出
-
-            completion = self.client.chat.completions.create(
-                model="qwen3-max",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的考试质量评估专家。请客观、严格地评估题目质量，以JSON格式返回评估结果。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                response_format={"type": "json_object"}
-            )
+    FIX_RULES = """你是一个专业的考试命题专家。请根据反馈认真修正题目，确保题目质量，以JSON格式返回。
 
-            logging.info(f"  AI评估完成，正在解析结果...")
-            sys.stdout.flush()  # 立即刷新输出
+【修正要求】
+1. 针对每个问题进行修正
+2. 保持题目总数不变
+3. 确保修正后的题目符合所有格式要求
+4. 题目内容必须基于知识点内容
+5. 避免题目重复
 
-            json_string = completion.choices[0].message.content
-            evaluation = json.loads(json_string)
+【输出格式】
+请以JSON格式输出修正后的完整题目列表：
+{
+    "题目列表": [
+        {
+            "题目类型": "单选/判断/多选",
+            "题干": "...",
+            "选项A": "...",
+            "答案": "..."
+        }
+    ]
+}
+"""
+
+    def __init__(self):
+        """初始化生成器"""
+        api_key = os.getenv("DASHSCOPE_API_KEY")
+        if not api_key:
+            raise ValueError("请在.env文件中设置DASHSCOPE_API_KEY")
+
+        self._api_key = api_key
+
+        # 同时处理的鉴定点数量上限（LLM调用以网络等待为主，并发处理多个鉴定点）
+        self.max_concurrent_points = _positive_int_env("DASHSCOPE_CONCURRENCY", _DEFAULT_CONCURRENCY)
+
+        # API客户端和并发限制只能在一个事件循环中使用，开始处理时再为当前事件循环创建
+        self._loop = None
+        self.client = None
+        self._semaphore = None
+
+        # LLM响应缓存，重复运行时相同请求不再调用API
+        self.cache = ResponseCache(LLM_CACHE_PATH)
+
+        # 按账号的RPM/TPM额度主动限流，避免并发请求触发限流后反复退避重试
+        self.limiter = RateLimiter(_positive_int_env("DASHSCOPE_RPM", _DEFAULT_RPM),
+                                   _positive_int_env("DASHSCOPE_TPM", _DEFAULT_TPM))
+
+        # 各输出目录中已完成的鉴定点编号，每保存一个鉴定点就写入进度文件
+        self._progress = {}
+
+        # 各等级的题目数量要求文本，拼接prompt时复用
+        self._quantity_texts = {}
+
+        # 保存题目时共用的XLS样式和Word模板，首次保存时创建
+        self._xls_style = None
+        self._docx_template = None
+
+        # resources目录的文件名索引，解析输入文件名时不必逐个stat
+        try:
+            with os.scandir(_RESOURCES_DIR) as it:
+                self._resources_index = frozenset(entry.name for entry in it)
+        except FileNotFoundError:
+            self._resources_index = frozenset()
+
+    def _bind_event_loop(self):
+        """
+        为当前事件循环创建API客户端和并发限制，并重建限流器的锁
+
+        process_file每次调用都用asyncio.run新建事件循环，上一次的对象不能再用；
+        同一事件循环中重复调用（如并发处理多个文件）时直接复用
+        """
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+
+        from openai import AsyncOpenAI
+
+        self._loop = loop
+
+        # 所有请求共用这一个客户端，其内部连接池保持长连接，省去重复的TCP/TLS握手
+        #（默认连接数上限远大于同时进行的请求数，无需另外设置）
+        self.client = AsyncOpenAI(
+            api_key=self._api_key,
+            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_points)
+        self.limiter.reset_lock()
+
+    def extract_level_from_filename(self, filename: str) -> Optional[str]:
+        """
+        从文件名中提取等级信息
+
+        Args:
+            filename: 文件名,例如 "三级3001-3010.xlsx"
+
+        Returns:
+            等级字符串,如 "三级",如果未找到则返回None
+        """
+        # 匹配 "一级", "二级", "三级", "四级", "五级"
+        match = self._LEVEL_RE.search(filename)
+        return match.group(0) if match else None
+
+    def detect_file_format(self, rows: List[tuple]) -> str:
+        """
+        根据工作表的前3行检测xlsx文件的格式类型
+
+        Args:
+            rows: 工作表前3行的单元格值
+
+        Returns:
+            格式类型: "format1"、"format2" 或 "format3"
+        """
+        # 检查第1行是否包含表头关键字
+        if len(rows) >= 1:
+            row1 = rows[0]
+            row1_str = ' '.join(map(str, filter(None, row1)))
+            
+            # 检查是否为format3（四级文件格式）
+            # 特征：第1行包含"鉴定范围"且第6列为"题目序号"
+            if '鉴定范围' in row1_str and len(row1) > 5:
+                col6_str = str(row1[5]) if row1[5] else ''
+                if '题目序号' in col6_str:
+                    return "format3"
+            
+            # 如果第1行包含"题目序号"、"鉴定点"、"资料"等关键字，判定为格式2
+            if any(keyword in row1_str for keyword in _FORMAT2_KEYWORDS):
+                return "format2"
+
+        # 检查第2行是否包含表头关键字（format2的另一种情况）
+        if len(rows) >= 2:
+            row2 = rows[1]
+            row2_str = ' '.join(map(str, filter(None, row2)))
+            # 如果第2行包含"题目序号"、"鉴定点"、"资料"等关键字，判定为格式2
+            if any(keyword in row2_str for keyword in _FORMAT2_KEYWORDS):
+                return "format2"
+
+        # 检查第1行第1列是否为数字（序号）- format1的特征
+        if len(rows) >= 1 and rows[0][0]:
+            first_cell = str(rows[0][0])
+            if first_cell.isdigit():
+                return "format1"
+
+        return "format1"  # 默认格式1
+
+    def read_knowledge_points(self, filepath: str) -> List[Dict[str, str]]:
+        """
+        读取xlsx文件中的鉴定点信息（自动检测格式）
+
+        Args:
+            filepath: xlsx文件路径
+
+        Returns:
+            鉴定点列表,每个元素包含 {"编号": "...", "名称": "...", "内容": "..."}
+        """
+        # 只读模式流式解析，整个文件只打开一次
+        wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+
+            # 先取前3行检测格式，其余行按格式只读取需要的列
+            head = list(ws.iter_rows(min_row=1, max_row=3, values_only=True))
+            file_format = self.detect_file_format(head)
+            logging.info("  检测到文件格式: %s", file_format)
+            rest_min_row = len(head) + 1
+
+            knowledge_points = []
+
+            if file_format == "format1":
+                # 格式1: 第1列=序号, 第2列=编号, 第3列=名称, 第4列=内容
+                rows = ws.iter_rows(min_row=rest_min_row, max_col=4, values_only=True)
+                for row in itertools.chain(head, rows):
+                    if row[0] is None:  # 跳过空行
+                        continue
+
+                    # 获取编号并标准化（将中文破折号替换为英文连字符）
+                    code = str(row[1]).translate(_DASH_TABLE) if row[1] else ""
+
+                    point = {
+                        "序号": str(row[0]) if row[0] else "",
+                        "编号": code,  # 使用标准化后的编号
+                        "名称": str(row[2]) if row[2] else "",
+                        "内容": str(row[3]) if row[3] else "",
+                    }
+                    knowledge_points.append(point)
+
+            elif file_format == "format2":
+                # 格式2: 跳过第1行（表头）, 第1列=编号, 第2列=名称, 第3列=内容（索引2）
+                rows = ws.iter_rows(min_row=rest_min_row, max_col=3, values_only=True)
+                for row in itertools.chain(head[1:], rows):
+                    # 获取编号并标准化（将中文破折号替换为英文连字符），跳过空行（第1列为空）
+                    code = _cell_str(row[0]).translate(_DASH_TABLE)
+                
+                    # 检查是否为有效的鉴定点编号（格式如 A-B-A-001）
+                    if not code or len(code) < 5:
+                        continue
+                
+                    # 跳过表头行（如果编号包含"题目序号"等关键字）
+                    if any(keyword in code for keyword in _HEADER_KEYWORDS):
+                        continue
+
+                    point = {
+                        "序号": code,  # 第1列就是序号/编号
+                        "编号": code,  # 使用标准化后的编号
+                        "名称": _cell_str(row[1]) if len(row) > 1 else "",
+                        "内容": _cell_str(row[2]) if len(row) > 2 else "",  # 第3列是内容
+                    }
+                    knowledge_points.append(point)
+
+            else:  # format3
+                # 格式3: 四级文件格式，跳过第1行（表头）
+                # 第6列=编号, 第7列=名称, 第9列=内容，只读取第6~9列（索引0~3）
+                rows = ws.iter_rows(min_row=rest_min_row, min_col=6, max_col=9, values_only=True)
+                for row in itertools.chain((row[5:9] for row in head[1:]), rows):
+                    # 跳过列数不足的行（第6列为空的行由下面的编号检查跳过）
+                    if not row:
+                        continue
+
+                    # 获取编号并标准化（将中文破折号替换为英文连字符）
+                    code = _cell_str(row[0]).translate(_DASH_TABLE)
+                
+                    # 检查是否为有效的鉴定点编号（格式如 B-D-A-001）
+                    if not code or len(code) < 5 or '-' not in code:
+                        continue
+                
+                    # 跳过表头行
+                    if any(keyword in code for keyword in _HEADER_KEYWORDS):
+                        continue
+
+                    point = {
+                        "序号": code,  # 使用编号作为序号
+                        "编号": code,  # 使用标准化后的编号
+                        "名称": _cell_str(row[1]) if len(row) > 1 else "",
+                        "内容": _cell_str(row[3]) if len(row) > 3 else "",
+                    }
+                    knowledge_points.append(point)
+        finally:
+            # 只读模式会一直打开xlsx文件，读取出错时也要关闭
+            wb.close()
+
+        return knowledge_points
+
+
+    async def _chat(self, system_prompt: str, user_prompt: str, use_cache: bool = True,
+                    temperature: Optional[float] = None) -> str:
+        """
+        调用LLM并返回JSON字符串，相同的请求优先使用本地缓存
+
+        Args:
+            system_prompt: 系统提示词
+            user_prompt: 用户提示词
+            use_cache: 是否读取缓存（有效的响应总会写入缓存）
+            temperature: 采样温度，为None时使用模型默认值
+
+        Returns:
+            LLM返回的JSON字符串
+        """
+        from openai import RateLimitError
+
+        key_parts = [self.MODEL, system_prompt, user_prompt]
+        options = {}
+        if temperature is not None:
+            key_parts.append(f"temperature={temperature}")
+            options["temperature"] = temperature
+        key = ResponseCache.make_key(*key_parts)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logging.info("  命中本地缓存，跳过AI调用")
+                return cached
+
+        tokens = _estimate_tokens(system_prompt) + _estimate_tokens(user_prompt) + _ESTIMATED_OUTPUT_TOKENS
+        for attempt in range(_RATE_LIMIT_RETRIES + 1):
+            await self.limiter.acquire(tokens)
+            try:
+                start = time.monotonic()
+                stream = await self.client.chat.completions.create(
+                    model=self.MODEL,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": system_prompt
+                        },
+                        {
+                            "role": "user",
+                            "content": user_prompt
+                        }
+                    ],
+                    response_format={"type": "json_object"},
+                    stream=True,
+                    **options
+                )
+
+                # 流式接收响应，记录首个token的等待时间，区分排队/预填充和生成耗时
+                buffer = io.StringIO()
+                first_token = True
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        if first_token:
+                            first_token = False
+                            logging.info("  AI开始响应（首个token用时 %.1f 秒）", time.monotonic() - start)
+                        buffer.write(content)
+                break
+            except RateLimitError:
+                if attempt == _RATE_LIMIT_RETRIES:
+                    raise
+                # 实际额度低于配置值，下调速率上限后重试（同时被限流的请求只下调一次）
+                if self.limiter.decay():
+                    logging.warning(f"  ⚠️  触发API限流，下调速率上限后重试"
+                                    f"（RPM {self.limiter.rpm:.0f}，TPM {self.limiter.tpm:.0f}）")
+                else:
+                    logging.warning(f"  ⚠️  触发API限流，稍后重试")
+        json_string = buffer.getvalue()
+        logging.info("  AI响应接收完成（总用时 %.1f 秒）", time.monotonic() - start)
+
+        # 只缓存能正常解析的响应
+        try:
+            json.loads(json_string)
+        except (TypeError, json.JSONDecodeError):
+            return json_string
+        self.cache.set(key, json_string)
+        return json_string
+
+    def _quantity_requirements(self, level: str) -> str:
+        """
+        获取prompt中该等级的题目数量要求（每个等级只拼接一次）
+
+        Args:
+            level: 等级
+
+        Returns:
+            题目数量要求文本
+        """
+        text = self._quantity_texts.get(level)
+        if text is None:
+            requirements = self.LEVEL_REQUIREMENTS[level]
+            text = f"""- 单选题：{requirements['单选']}道（每题4个选项，有且只有一个正确答案）
+- 判断题：{requirements['判断']}道（答案为"正确"或"错误"）
+- 多选题：{requirements['多选']}道（每题5个选项，有两个或以上正确答案）
+"""
+            self._quantity_texts[level] = text
+        return text
+
+    async def generate_all_questions_at_once(self, knowledge_point: Dict[str, str],
+                                             level: str,
+                                             use_cache: bool = True,
+                                             temperature: Optional[float] = None) -> Optional[List[Dict]]:
+        """
+        一次性生成一个鉴定点的所有题目（避免重复）
+
+        Args:
+            knowledge_point: 鉴定点信息
+            level: 等级（仅用于确定题目数量，不影响难度）
+            use_cache: 是否使用缓存的生成结果（重新生成时应为False）
+            temperature: 采样温度，为None时使用模型默认值
+
+        Returns:
+            题目列表，如果生成失败返回None
+        """
+        # 检查知识点内容是否为空
+        content = knowledge_point.get('内容', '').strip()
+        if not content:
+            logging.error(f"  ❌ 错误：鉴定点内容为空，无法生成题目")
+            logging.error(f"  鉴定点编号: {knowledge_point.get('编号', '未知')}")
+            logging.error(f"  鉴定点名称: {knowledge_point.get('名称', '未知')}")
+            return None
+        
+        # 构建prompt：出题规则固定放在系统提示词中，这里只放每个鉴定点不同的内容
+        prompt = f"""请根据以下知识点内容，一次性生成该鉴定点的全部考题。
+
+【知识点信息】
+鉴定点编号: {knowledge_point['编号']}
+鉴定点名称: {knowledge_point['名称']}
+知识点内容: {knowledge_point['内容']}
+
+【题目数量】
+{self._quantity_requirements(level)}"""
+
+        try:
+            _progress("  正在调用AI生成题目...")
+
+            json_string = await self._chat(self.SYSTEM_RULES, prompt, use_cache=use_cache,
+                                           temperature=temperature)
+
+            logging.info("  AI响应完成，正在解析结果...")
+
+            # 记录原始响应（用于调试）
+            logging.debug("  AI原始响应: %s...", json_string[:500])
+            
+            response_data = json.loads(json_string)
+
+            # 提取题目列表
+            questions = response_data.get("题目列表", [])
+            
+            # 检查是否成功生成题目
+            if not questions:
+                logging.warning(f"  ⚠️  AI返回了空的题目列表")
+                logging.info("  完整响应: %s", json_string)
+                return None
+
+            # 为每个题目添加鉴定点编号
+            for q in questions:
+                q["鉴定点编号"] = knowledge_point["编号"]
+
+            return questions
+
+        except json.JSONDecodeError as e:
+            logging.error(f"  ❌ JSON解析失败: {e}")
+            logging.error(f"  AI响应内容: {json_string[:1000] if 'json_string' in locals() else '未获取到响应'}")
+            return None
+        except KeyError as e:
+            logging.error(f"  ❌ 响应格式错误，缺少必要字段: {e}")
+            logging.error(f"  响应内容: {response_data if 'response_data' in locals() else '未解析'}")
+            return None
+        except Exception as e:
+            logging.error(f"  ❌ 生成题目时出错: {type(e).__name__}: {e}")
+            return None
+
+    def get_batch_size(self, knowledge_points: List[Dict[str, str]], level: str) -> int:
+        """
+        根据知识点平均长度和题目数量确定每批生成的鉴定点数量
+
+        Args:
+            knowledge_points: 鉴定点列表
+            level: 等级
+
+        Returns:
+            每批的鉴定点数量（至少为1）
+        """
+        if not knowledge_points:
+            return 1
+        question_count = sum(self.LEVEL_REQUIREMENTS[level].values())
+        avg_input = sum(_estimate_tokens(kp['名称']) + _estimate_tokens(kp['内容'])
+                        for kp in knowledge_points) // len(knowledge_points)
+        avg_tokens_per_point = avg_input + question_count * self.TOKENS_PER_QUESTION
+        return max(1, self.BATCH_TOKEN_BUDGET // avg_tokens_per_point)
+
+    async def generate_all_questions_batch(self, knowledge_points: List[Dict[str, str]],
+                                           level: str) -> Dict[str, List[Dict]]:
+        """
+        一次请求为多个鉴定点生成题目，分摊每次调用的固定开销
+
+        Args:
+            knowledge_points: 鉴定点列表（内容不能为空）
+            level: 等级（仅用于确定题目数量，不影响难度）
+
+        Returns:
+            {鉴定点编号: 题目列表}，生成失败或缺少的鉴定点不在结果中
+        """
+        points_text = json.dumps(
+            [{"编号": kp['编号'], "名称": kp['名称'], "内容": kp['内容']} for kp in knowledge_points],
+            ensure_ascii=False, separators=(',', ':')
+        )
+
+        prompt = f"""请根据以下每个知识点的内容，分别一次性生成该鉴定点的全部考题。各鉴定点的题目相互独立。
+
+【知识点列表】
+{points_text}
+
+【题目数量】（每个鉴定点）
+{self._quantity_requirements(level)}
+【批量输出格式】
+请以JSON格式输出，包含一个"结果"数组，每个鉴定点一项，"题目列表"的格式与上文要求相同：
+{{
+    "结果": [
+        {{
+            "编号": "鉴定点编号",
+            "题目列表": [...]
+        }}
+    ]
+}}
+"""
+
+        codes = {kp['编号'] for kp in knowledge_points}
+        try:
+            _progress("  正在调用AI批量生成 %d 个鉴定点的题目...", len(knowledge_points))
+
+            json_string = await self._chat(self.SYSTEM_RULES, prompt)
+            response_data = json.loads(json_string)
+
+            results = {}
+            for item in response_data.get("结果", []):
+                code = item.get("编号")
+                questions = item.get("题目列表")
+                if code not in codes or not questions:
+                    continue
+                for q in questions:
+                    q["鉴定点编号"] = code
+                results[code] = questions
+
+            logging.info("  ✓ 批量生成完成: %d/%d 个鉴定点", len(results), len(knowledge_points))
+            return results
+
+        except Exception as e:
+            logging.error(f"  ❌ 批量生成题目时出错: {type(e).__name__}: {e}")
+            return {}
+
+    async def pregenerate_questions(self, knowledge_points: List[Dict[str, str]],
+                                    level: str) -> Dict[str, List[Dict]]:
+        """
+        将鉴定点分批，并发批量生成各鉴定点第一轮的题目
+
+        Args:
+            knowledge_points: 鉴定点列表
+            level: 等级
+
+        Returns:
+            {鉴定点编号: 题目列表}
+        """
+        # 内容为空的鉴定点留给逐个生成时报错
+        points = [kp for kp in knowledge_points if kp.get('内容', '').strip()]
+        batch_size = self.get_batch_size(points, level)
+        if batch_size <= 1:
+            return {}
+
+        batches = [points[i:i + batch_size] for i in range(0, len(points), batch_size)]
+        logging.info("✓ 批量生成: 每批 %d 个鉴定点，共 %d 批", batch_size, len(batches))
+
+        async def run(batch):
+            async with self._semaphore:
+                return await self.generate_all_questions_batch(batch, level)
+
+        pregenerated = {}
+        for results in await asyncio.gather(*(run(batch) for batch in batches)):
+            pregenerated.update(results)
+        return pregenerated
+
+    def _rule_check(self, questions: List[Dict]) -> List[Dict]:
+        """
+        用规则检查题目中不需要AI判断的问题（章节编号、图表引用、选项重复等）
+
+        Args:
+            questions: 题目列表
+
+        Returns:
+            问题列表，格式与AI评估结果中的"问题列表"相同
+        """
+        problems = []
+
+        def add(index, problem_type, description, severity="严重"):
+            problems.append({"题目序号": index, "问题类型": problem_type,
+                             "问题描述": description, "严重程度": severity})
+
+        blank_at_end = []  # 各选择题的括号是否在题干尾部
+        for index, q in enumerate(questions, 1):
+            # AI可能返回数字或null（如选项"1/2/3/4"），统一转为字符串再检查
+            question_type = q.get("题目类型", "")
+            stem = str(q.get("题干") or "").strip()
+            options = [str(q.get(f"选项{key}") or "").strip() for key in "ABCDE"]
+            options = [o for o in options if o]
+            text = stem + "\n" + "\n".join(options)
+
+            if _SECTION_RE.search(text):
+                add(index, "有效性", "题干或选项中出现章节编号")
+            if _FIGURE_RE.search(text):
+                add(index, "有效性", "题干或选项中出现图表或图纸引用")
+            if _EXAMPLE_RE.search(stem):
+                add(index, "有效性", "题目为\"例如（   ）\"形式的举例题")
+            if _ETC_RE.search(stem):
+                add(index, "格式规范", "题干中出现\"（   ）等\"模糊表述")
+            if any(word in stem for word in _META_WORDS):
+                add(index, "格式规范", "题干中出现\"鉴定点\"、\"知识点\"等指向不明的词汇")
+            if not stem.endswith("。"):
+                add(index, "格式规范", "题干不是以句号结束的陈述句", "一般")
+
+            if question_type in ("单选", "多选"):
+                if len(set(options)) < len(options):
+                    add(index, "选项准确度", "选项内容有重复")
+                blanks = _BLANK_RE.findall(stem)
+                if len(blanks) != 1:
+                    add(index, "格式规范", f"题干中应有且只有一个括号，实际有 {len(blanks)} 个", "一般")
+                else:
+                    blank_at_end.append(bool(_TAIL_BLANK_RE.search(stem)))
+
+        if len(blank_at_end) > 1 and all(blank_at_end):
+            add(0, "格式规范", "所有选择题的括号都在题干尾部，缺少位置多样性")
+
+        return problems
+
+    async def evaluate_questions(self, knowledge_point: Dict[str, str],
+                                 questions: List[Dict]) -> Dict:
+        """
+        评估生成的题目质量
+
+        Args:
+            knowledge_point: 鉴定点信息
+            questions: 生成的题目列表
+
+        Returns:
+            评估结果，包含问题和建议
+        """
+        # 先做规则检查，有严重问题时不必再调用AI评估；规则检查出错时直接交给AI评估
+        try:
+            rule_problems = self._rule_check(questions)
+        except Exception as e:
+            logging.error(f"规则检查题目时出错: {type(e).__name__}: {e}")
+            rule_problems = []
+        if any(p["严重程度"] == "严重" for p in rule_problems):
+            logging.info("  规则检查发现 %d 个问题，跳过AI评估", len(rule_problems))
+            return {"总体评价": "需要改进", "是否通过": False, "问题列表": rule_problems, "修改建议": []}
+
+        # 构建评估prompt
+        questions_text = json.dumps(questions, ensure_ascii=False, separators=(',', ':'))
+
+        prompt = f"""请对以下生成的考题进行全面评估。
+
+【知识点信息】
+鉴定点编号: {knowledge_point['编号']}
+鉴定点名称: {knowledge_point['名称']}
+知识点内容: {knowledge_point['内容']}
+
+【生成的题目】
+{questions_text}
+"""
+
+        try:
+            _progress("  正在调用AI评估题目...")
+
+            json_string = await self._chat(self.EVALUATION_RULES, prompt)
+
+            logging.info("  AI评估完成，正在解析结果...")
+
+            evaluation = json.loads(json_string)
+
+            # 规则检查发现的一般问题一并交给后续修正
+            if rule_problems:
+                evaluation.setdefault("问题列表", []).extend(rule_problems)
 
             return evaluation
 
@@ -728,9 +1377,9 @@ class QuestionGenerator:
             logging.error(f"评估题目时出错: {e}")
             return {"是否通过": True, "问题列表": [], "修改建议": []}
 
-    def fix_questions(self, knowledge_point: Dict[str, str],
-                     questions: List[Dict],
-                     evaluation: Dict) -> Optional[List[Dict]]:
+    async def fix_questions(self, knowledge_point: Dict[str, str],
+                            questions: List[Dict],
+                            evaluation: Dict) -> Optional[List[Dict]]:
         """
         根据评估结果修正题目
 
@@ -742,12 +1391,11 @@ class QuestionGenerator:
         Returns:
             修正后的题目列表
         """
-        questions_text = json.dumps(questions, ensure_ascii=False, indent=2)
-        problems_text = json.dumps(evaluation.get("问题列表", []), ensure_ascii=False, indent=2)
-        suggestions_text = json.dumps(evaluation.get("修改建议", []), ensure_ascii=False, indent=2)
+        questions_text = json.dumps(questions, ensure_ascii=False, separators=(',', ':'))
+        problems_text = json.dumps(evaluation.get("问题列表", []), ensure_ascii=False, separators=(',', ':'))
+        suggestions_text = json.dumps(evaluation.get("修改建议", []), ensure_ascii=False, separators=(',', ':'))
 
-        prompt = f"""
-你是一个专业的考试命题专家。请根据评估反馈，修正以下题目中存在的问题。
+        prompt = f"""请根据评估反馈，修正以下题目中存在的问题。
 
 【知识点信息】
 鉴定点编号: {knowledge_point['编号']}
@@ -762,51 +1410,15 @@ class QuestionGenerator:
 
 【修改建议】
 {suggestions_text}
-
-【修正要求】
-1. 针对每个问题进行修正
-2. 保持题目总数不变
-3. 确保修正后的题目符合所有格式要求
-4. 题目内容必须基于知识点内容
-5. 避免题目重复
-
-【输出格式】
-请以JSON格式输出修正后的完整题目列表：
-{{
-    "题目列表": [
-        {{
-            "题目类型": "单选/判断/多选",
-            "题干": "...",
-            "选项A": "...",
-            "答案": "..."
-        }}
-    ]
-}}
 """
 
         try:
-            logging.info(f"  正在调用AI修正题目...")
-            sys.stdout.flush()  # 立即刷新输出
-
-            completion = self.client.chat.completions.create(
-                model="qwen3-max",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的考试命题专家。请根据反馈认真修正题目，确保题目质量，以JSON格式返回。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                response_format={"type": "json_object"}
-            )
+            _progress("  正在调用AI修正题目...")
+
+            json_string = await self._chat(self.FIX_RULES, prompt)
 
-            logging.info(f"  AI修正完成，正在解析结果...")
-            sys.stdout.flush()  # 立即刷新输出
+            logging.info("  AI修正完成，正在解析结果...")
 
-            json_string = completion.choices[0].message.content
             response_data = json.loads(json_string)
 
             # 提取题目列表
@@ -822,8 +1434,62 @@ class QuestionGenerator:
             logging.error(f"修正题目时出错: {e}")
             return None
 
-    def generate_questions_for_point(self, knowledge_point: Dict[str, str],
-                                    level: str) -> List[Dict]:
+    async def generate_candidates(self, knowledge_point: Dict[str, str], level: str,
+                                  initial_questions: Optional[List[Dict]] = None
+                                  ) -> Tuple[Optional[List[Dict]], Dict]:
+        """
+        用不同温度并发生成多份候选题目并同时评估，返回其中最好的一份
+
+        有批量生成的题目时先单独评估，达到优秀即直接采用，不再额外生成候选题目
+
+        Args:
+            knowledge_point: 鉴定点信息
+            level: 等级
+            initial_questions: 批量生成的题目，作为其中一份候选
+
+        Returns:
+            (题目列表, 评估结果)，全部生成失败时题目列表为None
+        """
+        def is_excellent(evaluation):
+            return evaluation.get("是否通过", False) and evaluation.get("总体评价") == "优秀"
+
+        candidates, evaluations = [], []
+        if initial_questions:
+            evaluation = await self.evaluate_questions(knowledge_point, initial_questions)
+            if is_excellent(evaluation):
+                return initial_questions, evaluation
+            logging.info("  批量生成的题目未达到优秀，继续生成其他候选题目...")
+            candidates.append(initial_questions)
+            evaluations.append(evaluation)
+
+        temperatures = self.SPECULATIVE_TEMPERATURES[len(candidates):]
+        generated = await asyncio.gather(*(self.generate_all_questions_at_once(knowledge_point, level,
+                                                                               temperature=t)
+                                           for t in temperatures))
+        generated = [c for c in generated if c]
+        if not candidates and not generated:
+            return None, {}
+
+        if generated:
+            logging.info("  ✓ 成功生成 %d 份候选题目，正在评估题目质量...", len(generated))
+            evaluations += await asyncio.gather(*(self.evaluate_questions(knowledge_point, c)
+                                                  for c in generated))
+            candidates += generated
+
+        # 优先选评级高、严重问题少、问题总数少的一份
+        def score(evaluation):
+            problems = evaluation.get("问题列表", [])
+            return (not is_excellent(evaluation),
+                    self.OVERALL_RANK.get(evaluation.get("总体评价"), len(self.OVERALL_RANK)),
+                    sum(p.get("严重程度") == "严重" for p in problems),
+                    len(problems))
+
+        best = min(range(len(candidates)), key=lambda i: score(evaluations[i]))
+        return candidates[best], evaluations[best]
+
+    async def generate_questions_for_point(self, knowledge_point: Dict[str, str],
+                                           level: str,
+                                           initial_questions: Optional[List[Dict]] = None) -> List[Dict]:
         """
         为单个鉴定点生成所有题目（包含质量评估和修正机制）
         要求：必须达到"优秀"评级才能保存
@@ -831,86 +1497,123 @@ class QuestionGenerator:
         Args:
             knowledge_point: 鉴定点信息
             level: 等级（仅用于确定题目数量：一级/二级/三级=7题，四级/五级=6题）
+            initial_questions: 批量生成的题目，有则作为第一轮的题目，不再单独生成
 
         Returns:
             题目列表
         """
-        logging.info(f"\n正在为鉴定点 {knowledge_point['编号']} 生成题目...")
-        sys.stdout.flush()
+        code = knowledge_point['编号']  # 多个鉴定点并发处理，关键日志带上编号
+        logging.info("\n正在为鉴定点 %s 生成题目...", code)
 
         max_iterations = 5  # 增加最大迭代次数，确保有足够机会达到优秀
         iteration = 0
 
         while iteration < max_iterations:
             iteration += 1
-            logging.info(f"\n  第 {iteration} 轮生成...")
-            sys.stdout.flush()
-
-            # 生成题目
-            questions = self.generate_all_questions_at_once(knowledge_point, level)
+            logging.info("\n  [%s] 第 %d 轮生成...", code, iteration)
+
+            if iteration == 1:
+                # 第一轮并发生成多份候选题目，取评估最好的一份（允许复用缓存）
+                questions, evaluation = await self.generate_candidates(knowledge_point, level,
+                                                                       initial_questions)
+                if not questions:
+                    logging.warning(f"  ❌ 生成失败")
+                    continue
+            else:
+                # 重新生成需要新的结果，不读缓存
+                questions = await self.generate_all_questions_at_once(knowledge_point, level,
+                                                                      use_cache=False)
 
-            if not questions:
-                logging.warning(f"  ❌ 生成失败")
-                sys.stdout.flush()
-                continue
+                if not questions:
+                    logging.warning(f"  ❌ 生成失败")
+                    continue
 
-            logging.info(f"  ✓ 成功生成 {len(questions)} 道题目")
-            sys.stdout.flush()
+                logging.info("  ✓ 成功生成 %d 道题目", len(questions))
 
-            # 评估题目质量
-            logging.info(f"  正在评估题目质量...")
-            sys.stdout.flush()
-            evaluation = self.evaluate_questions(knowledge_point, questions)
+                # 评估题目质量
+                logging.info("  正在评估题目质量...")
+                evaluation = await self.evaluate_questions(knowledge_point, questions)
 
             is_passed = evaluation.get("是否通过", False)
             problems = evaluation.get("问题列表", [])
             overall = evaluation.get("总体评价", "未知")
 
-            logging.info(f"  评估结果: {overall}")
-            sys.stdout.flush()
+            logging.info("  [%s] 评估结果: %s", code, overall)
 
             # 只接受"优秀"评级
             if overall == "优秀" and is_passed:
-                logging.info(f"  ✓ 题目质量优秀，通过评估！")
-                sys.stdout.flush()
+                logging.info("  ✓ [%s] 题目质量优秀，通过评估！", code)
                 return questions
             elif overall == "良好":
                 logging.warning(f"  ⚠ 题目质量为良好，需要优化至优秀")
                 logging.warning(f"  ⚠ 发现 {len(problems)} 个问题，需要改进")
-                sys.stdout.flush()
             else:
                 logging.warning(f"  ⚠ 题目质量需要改进，发现 {len(problems)} 个问题")
-                sys.stdout.flush()
 
             # 显示问题
             for i, problem in enumerate(problems[:3], 1):  # 只显示前3个问题
-                logging.info(f"    - 题目{problem.get('题目序号', '?')}: {problem.get('问题描述', '')[:50]}...")
-            sys.stdout.flush()
+                logging.info("    - 题目%s: %s...", problem.get('题目序号', '?'), problem.get('问题描述', '')[:50])
 
             if iteration < max_iterations:
-                logging.info(f"  正在优化题目...")
-                sys.stdout.flush()
-                fixed_questions = self.fix_questions(knowledge_point, questions, evaluation)
+                logging.info("  正在优化题目...")
+                fixed_questions = await self.fix_questions(knowledge_point, questions, evaluation)
 
                 if fixed_questions:
                     questions = fixed_questions
-                    logging.info(f"  ✓ 题目已优化，进入下一轮评估")
-                    sys.stdout.flush()
+                    logging.info("  ✓ 题目已优化，进入下一轮评估")
                 else:
                     logging.warning(f"  ❌ 优化失败，重新生成")
-                    sys.stdout.flush()
                     continue
             else:
-                logging.warning(f"  ⚠ 已达到最大迭代次数（{max_iterations}轮）")
+                logging.warning(f"  ⚠ [{code}] 已达到最大迭代次数（{max_iterations}轮）")
                 if overall == "良好":
                     logging.warning(f"  ⚠ 当前评级为良好，建议手动检查")
-                sys.stdout.flush()
                 return questions
 
-        logging.error(f"  ❌ 未能生成优秀级别的题目")
-        sys.stdout.flush()
+        logging.error(f"  ❌ [{code}] 未能生成优秀级别的题目")
         return []
 
+    def _get_xls_style(self):
+        """
+        获取XLS单元格的宋体样式（首次使用时创建，之后各次保存共用）
+
+        Returns:
+            xlwt.XFStyle
+        """
+        if self._xls_style is None:
+            import xlwt
+
+            style = xlwt.XFStyle()
+            font = xlwt.Font()
+            font.name = '宋体'
+            font.height = 220  # 11号字体 (20 * 11)
+            style.font = font
+            self._xls_style = style
+        return self._xls_style
+
+    def _get_docx_template(self) -> bytes:
+        """
+        获取Word文档模板（首次使用时创建，默认字体设为宋体11号）
+
+        Returns:
+            模板docx文件的内容
+        """
+        if self._docx_template is None:
+            from docx import Document
+            from docx.shared import Pt
+
+            doc = Document()
+
+            # 设置默认字体为宋体
+            style = doc.styles['Normal']
+            style.font.name = '宋体'
+            style.font.size = Pt(11)
+
+            buffer = io.BytesIO()
+            doc.save(buffer)
+            self._docx_template = buffer.getvalue()
+        return self._docx_template
+
     def save_questions_to_xls(self, questions: List[Dict],
                               output_filepath: str):
         """
@@ -920,29 +1623,24 @@ class QuestionGenerator:
             questions: 题目列表
             output_filepath: 输出文件路径
         """
+        import xlwt
+
         # 创建工作簿
         wb = xlwt.Workbook(encoding='utf-8')
         ws = wb.add_sheet('题目')
 
-        # 设置宋体样式
-        style = xlwt.XFStyle()
-        font = xlwt.Font()
-        font.name = '宋体'
-        font.height = 220  # 11号字体 (20 * 11)
-        style.font = font
+        # 宋体样式（各次保存共用）
+        style = self._get_xls_style()
 
         # 写入表头
-        headers = ["鉴定点代码", "题目类型代码", "试题(题干)",
-                  "选项A", "选项B", "选项C", "选项D", "选项E",
-                  "答案", "难度代码", "一致性代码"]
-        for col, header in enumerate(headers):
+        for col, header in enumerate(_XLS_HEADERS):
             ws.write(0, col, header, style)
 
-        # 写入题目
+        # 写入题目（每行只取一次Row对象，直接写入单元格）
+        get_row = ws.row
         for row_idx, q in enumerate(questions, start=1):
             # 确定题目类型代码
-            type_code_map = {"单选": "B", "判断": "C", "多选": "D"}
-            type_code = type_code_map.get(q.get("题目类型", ""), "B")
+            type_code = self.TYPE_CODE_MAP.get(q.get("题目类型", ""), "B")
 
             # 写入数据
             data = [
@@ -958,11 +1656,12 @@ class QuestionGenerator:
                 3,  # 难度代码
                 5   # 一致性代码
             ]
+            write = get_row(row_idx).write
             for col_idx, value in enumerate(data):
-                ws.write(row_idx, col_idx, value, style)
+                write(col_idx, value, style)
 
         wb.save(output_filepath)
-        logging.info(f"  ✓ XLS文件已保存到: {output_filepath}")
+        logging.info("  ✓ XLS文件已保存到: %s", output_filepath)
 
     def save_questions_to_docx(self, questions: List[Dict],
                                output_filepath: str):
@@ -973,54 +1672,44 @@ class QuestionGenerator:
             questions: 题目列表
             output_filepath: 输出文件路径
         """
-        doc = Document()
-
-        # 设置默认字体为宋体
-        style = doc.styles['Normal']
-        style.font.name = '宋体'
-        style.font.size = Pt(11)
+        from docx import Document
 
-        # 确定题目类型代码映射
-        type_code_map = {"单选": "B", "判断": "C", "多选": "D"}
+        # 从已设置好宋体的模板创建文档
+        doc = Document(io.BytesIO(self._get_docx_template()))
 
-        # 逐题写入
+        # 先拼好所有段落文本，段落继承Normal样式（宋体11号），不再逐段设置字体
+        paragraphs = []
         for idx, q in enumerate(questions):
             # 获取题目信息
             code = q.get("鉴定点编号", "")
-            type_code = type_code_map.get(q.get("题目类型", ""), "B")
-            question_text = q.get("题干", "")
-            answer = q.get("答案", "")
+            type_code = self.TYPE_CODE_MAP.get(q.get("题目类型", ""), "B")
 
             # 第1行: 鉴定点编号  题型  难度代码  一致性代码
-            p1 = doc.add_paragraph(f"{code}  {type_code}  3  5")
-            p1.style.font.name = '宋体'
-            p1.style.font.size = Pt(11)
+            paragraphs.append(f"{code}  {type_code}  3  5")
 
             # 第2行: {A} 题干
-            p2 = doc.add_paragraph(f"{{A}}{question_text}")
-            p2.style.font.name = '宋体'
-            p2.style.font.size = Pt(11)
+            paragraphs.append(f"{{A}}{q.get('题干', '')}")
 
             # 选项行 (单选和多选题)
-            if type_code in ["B", "D"]:  # 单选或多选
-                for option_key in ["A", "B", "C", "D", "E"]:
+            if type_code in ("B", "D"):  # 单选或多选
+                for option_key in "ABCDE":
                     option_value = q.get(f"选项{option_key}", "")
                     if option_value:  # 只写入非空选项
-                        p_opt = doc.add_paragraph(f"（{option_key}）{option_value}")
-                        p_opt.style.font.name = '宋体'
-                        p_opt.style.font.size = Pt(11)
+                        paragraphs.append(f"（{option_key}）{option_value}")
 
             # 答案行: {B} 答案
-            p_ans = doc.add_paragraph(f"{{B}}{answer}")
-            p_ans.style.font.name = '宋体'
-            p_ans.style.font.size = Pt(11)
+            paragraphs.append(f"{{B}}{q.get('答案', '')}")
 
             # 题目间空一行 (除了最后一题)
             if idx < len(questions) - 1:
-                doc.add_paragraph()
+                paragraphs.append("")
+
+        add_paragraph = doc.add_paragraph
+        for text in paragraphs:
+            add_paragraph(text)
 
         doc.save(output_filepath)
-        logging.info(f"  ✓ Word文档已保存到: {output_filepath}")
+        logging.info("  ✓ Word文档已保存到: %s", output_filepath)
 
     def get_existing_question_codes(self, output_dir: str) -> set:
         """
@@ -1032,18 +1721,15 @@ class QuestionGenerator:
         Returns:
             已存在题目的鉴定点编号集合
         """
-        existing_codes = set()
-        
-        if not os.path.exists(output_dir):
-            return existing_codes
-            
-        for filename in os.listdir(output_dir):
-            if filename.startswith("考题") and filename.endswith(".xls"):
-                # 从文件名中提取鉴定点编号，格式：考题A-B-A-001.xls
-                code = filename[2:-4]  # 去掉"考题"前缀和".xls"后缀
-                existing_codes.add(code)
-                
-        return existing_codes
+        # 从文件名中提取鉴定点编号，格式：考题A-B-A-001.xls（去掉"考题"前缀和".xls"后缀）
+        # is_file使用读取目录时得到的类型信息，不再逐个stat
+        try:
+            with os.scandir(output_dir) as it:
+                return {entry.name[2:-4] for entry in it
+                        if entry.name.startswith("考题") and entry.name.endswith(".xls")
+                        and entry.is_file(follow_symlinks=False)}
+        except FileNotFoundError:
+            return set()
 
     def resolve_input_path(self, input_path: str) -> str:
         """
@@ -1055,19 +1741,7 @@ class QuestionGenerator:
         Returns:
             完整的文件路径
         """
-        # 如果是绝对路径或相对路径（包含路径分隔符），直接使用
-        if os.path.sep in input_path or os.path.isabs(input_path):
-            return input_path
-        
-        # 如果只是文件名，在resources目录中查找
-        resources_dir = os.path.join(os.path.dirname(__file__), "resources")
-        resources_path = os.path.join(resources_dir, input_path)
-        
-        if os.path.exists(resources_path):
-            return resources_path
-        
-        # 如果resources目录中没有，返回原路径
-        return input_path
+        return _resolve_input_path(input_path, self._resources_index)
 
     def process_file(self, input_filepath: str, output_dir: str = None):
         """
@@ -1077,105 +1751,207 @@ class QuestionGenerator:
             input_filepath: 输入xlsx文件路径
             output_dir: 输出目录,如果为None则默认使用questions目录
         """
+        asyncio.run(self.process_file_async(input_filepath, output_dir))
+
+    async def process_file_async(self, input_filepath: str, output_dir: str = None):
+        """
+        处理单个输入文件,生成考题（多个鉴定点并发生成）
+
+        Args:
+            input_filepath: 输入xlsx文件路径
+            output_dir: 输出目录,如果为None则默认使用questions目录
+        """
+        self._bind_event_loop()
+
         # 解析输入文件路径
         resolved_input_path = self.resolve_input_path(input_filepath)
         
         # 检查文件是否存在
         if not os.path.exists(resolved_input_path):
             logging.error(f"❌ 错误: 文件不存在: {resolved_input_path}")
-            sys.stdout.flush()
             return
         
-        # 提取文件名
+        # 提取文件名，之后本文件的日志都带上文件名
         filename = os.path.basename(resolved_input_path)
-        logging.info(f"\n{'='*60}")
-        logging.info(f"处理文件: {filename}")
-        logging.info(f"文件路径: {resolved_input_path}")
-        logging.info(f"{'='*60}")
-        sys.stdout.flush()
+        _log_context.set((os.path.splitext(filename)[0],))
+        logging.info("\n" + "="*60)
+        logging.info("处理文件: %s", filename)
+        logging.info("文件路径: %s", resolved_input_path)
+        logging.info("="*60)
 
         # 提取等级信息
         level = self.extract_level_from_filename(filename)
         if not level:
             logging.error(f"❌ 错误: 无法从文件名 '{filename}' 中提取等级信息")
             logging.error(f"   文件名必须包含: 一级、二级、三级、四级或五级")
-            sys.stdout.flush()
             return
 
-        logging.info(f"✓ 检测到等级: {level}")
-        logging.info(f"✓ 出题要求: {self.LEVEL_REQUIREMENTS[level]}")
-        sys.stdout.flush()
-
-        # 读取鉴定点
-        logging.info(f"正在读取鉴定点...")
-        sys.stdout.flush()
-        knowledge_points = self.read_knowledge_points(resolved_input_path)
-        logging.info(f"✓ 读取到 {len(knowledge_points)} 个鉴定点")
-        sys.stdout.flush()
+        logging.info("✓ 检测到等级: %s", level)
+        logging.info("✓ 出题要求: %s", self.LEVEL_REQUIREMENTS[level])
 
         # 确定输出目录 - 在questions下创建以xlsx文件名命名的子目录
         if output_dir is None:
             # 默认保存到questions目录
-            base_output_dir = os.path.join(os.path.dirname(__file__), "questions")
             # 从文件名中提取基础名称（去掉.xlsx后缀）
             xlsx_basename = os.path.splitext(filename)[0]
             # 创建子目录：questions/五级5001-5010/
-            output_dir = os.path.join(base_output_dir, xlsx_basename)
+            output_dir = os.path.join(_QUESTIONS_DIR, xlsx_basename)
 
-        # 确保输出目录存在
-        if not os.path.exists(output_dir):
+        # 确保输出目录存在（多个文件并发处理时不先检查再创建，避免竞争）
+        try:
             os.makedirs(output_dir)
-            logging.info(f"✓ 创建输出目录: {output_dir}")
+            logging.info("✓ 创建输出目录: %s", output_dir)
+        except FileExistsError:
+            pass
+
+        logging.info("✓ 输出目录: %s", output_dir)
+
+        # 获取已存在的题目文件（从当前xlsx对应的子目录中），优先读取进度文件，过期时再扫描目录
+        progress = _load_progress(output_dir)
+        if progress is None:
+            progress = {"done": self.get_existing_question_codes(output_dir)}
+        existing_codes = progress["done"]
+        self._progress[output_dir] = progress
+
+        # xlsx自上次解析后未修改且其中的鉴定点都已完成时，不再读取xlsx
+        stat = os.stat(resolved_input_path)
+        source = progress.get("source")
+        if (source and source.get("mtime_ns") == stat.st_mtime_ns and source.get("size") == stat.st_size
+                and existing_codes.issuperset(source.get("codes", ()))):
+            logging.info("✓ %d 个鉴定点的题目都已存在，无需生成新题目", len(source['codes']))
+            return
 
-        logging.info(f"✓ 输出目录: {output_dir}")
-        sys.stdout.flush()
+        # 读取鉴定点
+        logging.info("正在读取鉴定点...")
+        knowledge_points = self.read_knowledge_points(resolved_input_path)
+        logging.info("✓ 读取到 %d 个鉴定点", len(knowledge_points))
+
+        progress["source"] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "codes": sorted({kp['编号'] for kp in knowledge_points}),
+        }
+        _save_progress(output_dir, progress)
 
-        # 获取已存在的题目文件（从当前xlsx对应的子目录中）
-        existing_codes = self.get_existing_question_codes(output_dir)
         if existing_codes:
-            logging.info(f"✓ 发现已存在 {len(existing_codes)} 个题目文件")
-            logging.info(f"  已存在的鉴定点: {', '.join(sorted(existing_codes))}")
+            logging.info("✓ 发现已存在 %d 个题目文件", len(existing_codes))
+            logging.info("  已存在的鉴定点: %s", ', '.join(sorted(existing_codes)))
         else:
-            logging.info(f"✓ 未发现已存在的题目文件，将生成所有题目")
-        sys.stdout.flush()
+            logging.info("✓ 未发现已存在的题目文件，将生成所有题目")
 
         # 筛选需要生成题目的鉴定点（增量生成）
         new_knowledge_points = [kp for kp in knowledge_points if kp['编号'] not in existing_codes]
         
         if not new_knowledge_points:
-            logging.info(f"✓ 所有鉴定点的题目都已存在，无需生成新题目")
-            sys.stdout.flush()
+            logging.info("✓ 所有鉴定点的题目都已存在，无需生成新题目")
             return
         
-        logging.info(f"✓ 需要生成题目的鉴定点: {len(new_knowledge_points)} 个")
-        sys.stdout.flush()
+        logging.info("✓ 需要生成题目的鉴定点: %d 个", len(new_knowledge_points))
 
-        # 为需要生成的鉴定点生成题目并保存
-        for i, kp in enumerate(new_knowledge_points, 1):
-            logging.info(f"\n{'─'*60}")
-            logging.info(f"鉴定点: {kp['编号']} - {kp['名称']}")
-            sys.stdout.flush()
+        # 名称和内容都相同的鉴定点（生成题目的prompt中只有编号不同）只生成一次，题目复制给其余鉴定点
+        groups = {}
+        for kp in new_knowledge_points:
+            if kp['内容'].strip():
+                key = hashlib.blake2b(f"{kp['名称']}\x00{kp['内容']}".encode('utf-8'), digest_size=16).digest()
+            else:
+                key = kp['编号']
+            groups.setdefault(key, []).append(kp)
+        if len(groups) < len(new_knowledge_points):
+            logging.info("✓ 其中 %d 个鉴定点与其他鉴定点名称和内容都相同，将复用题目", len(new_knowledge_points) - len(groups))
+        representatives = [group[0] for group in groups.values()]
+
+        # 先把多个鉴定点合并到少数几个请求中生成第一轮题目
+        pregenerated = await self.pregenerate_questions(representatives, level)
+
+        # 为需要生成的鉴定点并发评估、优化题目，每个鉴定点完成后立即保存
+        await asyncio.gather(*(self.generate_and_save(group[0], level, output_dir,
+                                                      pregenerated.get(group[0]['编号']), group[1:])
+                               for group in groups.values()))
+
+    async def generate_and_save(self, kp: Dict[str, str], level: str, output_dir: str,
+                                initial_questions: Optional[List[Dict]] = None,
+                                duplicates: List[Dict[str, str]] = ()):
+        """
+        为单个鉴定点生成题目并保存为XLS和Word文件
+
+        Args:
+            kp: 鉴定点信息
+            level: 等级
+            output_dir: 输出目录
+            initial_questions: 批量生成的第一轮题目
+            duplicates: 内容与kp相同的其他鉴定点，直接复用kp的题目
+        """
+        # 之后本鉴定点的日志（包括AI调用、评估、修正）都带上鉴定点编号
+        _log_context.set(_log_context.get() + (kp['编号'],))
+
+        async with self._semaphore:
+            logging.info("\n" + "─"*60)
+            logging.info("鉴定点: %s - %s", kp['编号'], kp['名称'])
 
             # 生成题目
-            questions = self.generate_questions_for_point(kp, level)
+            questions = await self.generate_questions_for_point(kp, level, initial_questions)
 
-            if not questions:
-                logging.warning(f"  ⚠ 警告: 该鉴定点未生成任何题目")
-                sys.stdout.flush()
-                continue
+        if not questions:
+            logging.warning(f"  ⚠ 警告: 鉴定点 {kp['编号']} 未生成任何题目")
+            return
+
+        logging.info("  ✓ 鉴定点 %s 成功生成 %d 道题目", kp['编号'], len(questions))
+
+        await self.save_questions(questions, kp['编号'], output_dir)
+
+        for duplicate in duplicates:
+            code = duplicate['编号']
+            logging.info("  ✓ 鉴定点 %s 与 %s 名称和内容都相同，复用其题目", code, kp['编号'])
+            await self.save_questions([dict(q, 鉴定点编号=code) for q in questions], code, output_dir)
+
+    async def save_questions(self, questions: List[Dict], code: str, output_dir: str):
+        """
+        将一个鉴定点的题目保存为XLS和Word文件（两个文件在线程中同时写入，不阻塞其他鉴定点）
+
+        Args:
+            questions: 题目列表
+            code: 鉴定点编号
+            output_dir: 输出目录
+        """
+        # 保存为XLS格式（保持原有格式）
+        xls_filename = f"考题{code}.xls"
+        xls_filepath = os.path.join(output_dir, xls_filename)
+
+        # 保存为Word文档
+        docx_filename = f"{code}.docx"
+        docx_filepath = os.path.join(output_dir, docx_filename)
+
+        await asyncio.gather(
+            asyncio.to_thread(self.save_questions_to_xls, questions, xls_filepath),
+            asyncio.to_thread(self.save_questions_to_docx, questions, docx_filepath),
+        )
+
+        # 记录进度
+        progress = self._progress.setdefault(output_dir, {"done": set()})
+        progress["done"].add(code)
+        _save_progress(output_dir, progress)
 
-            logging.info(f"  ✓ 成功生成 {len(questions)} 道题目")
-            sys.stdout.flush()
+async def _process_files(generator: QuestionGenerator, xlsx_files: List[str]) -> int:
+    """
+    并发处理多个xlsx文件（同时调用AI的鉴定点数量仍由生成器统一限制）
+
+    Args:
+        generator: 考题生成器
+        xlsx_files: xlsx文件名列表
 
-            # 保存为XLS格式（保持原有格式）
-            xls_filename = f"考题{kp['编号']}.xls"
-            xls_filepath = os.path.join(output_dir, xls_filename)
-            self.save_questions_to_xls(questions, xls_filepath)
+    Returns:
+        成功处理的文件数量
+    """
+    async def process(xlsx_file: str) -> bool:
+        try:
+            await generator.process_file_async(xlsx_file)
+            return True
+        except Exception as e:
+            logging.error(f"❌ 处理文件 {xlsx_file} 时出错: {e}")
+            return False
 
-            # 保存为Word文档
-            docx_filename = f"{kp['编号']}.docx"
-            docx_filepath = os.path.join(output_dir, docx_filename)
-            self.save_questions_to_docx(questions, docx_filepath)
+    results = await asyncio.gather(*(process(xlsx_file) for xlsx_file in xlsx_files))
+    return sum(results)
 
 
 def process_all_resources():
@@ -1184,93 +1960,82 @@ def process_all_resources():
     log_filepath = setup_logging()
     logging.info("="*60)
     logging.info("考题生成系统启动 - 批量增量处理模式")
-    logging.info(f"日志文件: {log_filepath}")
+    logging.info("日志文件: %s", log_filepath)
     logging.info("="*60)
-    sys.stdout.flush()
 
-    # 获取resources目录路径
-    script_dir = os.path.dirname(__file__)
-    resources_dir = os.path.join(script_dir, "resources")
-    
-    if not os.path.exists(resources_dir):
-        logging.error(f"❌ 错误: resources目录不存在: {resources_dir}")
-        sys.stdout.flush()
+    # 获取所有xlsx文件（scandir的目录项自带文件类型，无需逐个stat）
+    try:
+        with os.scandir(_RESOURCES_DIR) as it:
+            xlsx_files = [entry.name for entry in it
+                          if entry.is_file(follow_symlinks=False) and entry.name.endswith('.xlsx')]
+    except FileNotFoundError:
+        logging.error(f"❌ 错误: resources目录不存在: {_RESOURCES_DIR}")
         return
-
-    # 获取所有xlsx文件
-    xlsx_files = [f for f in os.listdir(resources_dir) if f.endswith('.xlsx')]
     
     if not xlsx_files:
         logging.info("✓ resources目录中没有找到xlsx文件")
-        sys.stdout.flush()
         return
 
-    logging.info(f"✓ 发现 {len(xlsx_files)} 个教材文件:")
+    logging.info("✓ 发现 %d 个教材文件:", len(xlsx_files))
     for f in sorted(xlsx_files):
-        logging.info(f"  - {f}")
-    sys.stdout.flush()
+        logging.info("  - %s", f)
 
     # 创建生成器
     try:
         generator = QuestionGenerator()
     except ValueError as e:
         logging.error(f"❌ 初始化失败: {e}")
-        logging.error("请确保在.env文件中设置了DASHSCOPE_API_KEY")
-        sys.stdout.flush()
+        logging.error("请检查.env文件中的DASHSCOPE_API_KEY、DASHSCOPE_RPM、DASHSCOPE_TPM、DASHSCOPE_CONCURRENCY等配置")
+        _flush_logs()
         return
 
-    # 处理每个文件
-    total_processed = 0
-    for xlsx_file in sorted(xlsx_files):
-        try:
-            generator.process_file(xlsx_file)
-            total_processed += 1
-        except Exception as e:
-            logging.error(f"❌ 处理文件 {xlsx_file} 时出错: {e}")
-            sys.stdout.flush()
-            continue
+    # 并发处理所有文件（共用一个事件循环、API客户端和并发限制）
+    total_processed = asyncio.run(_process_files(generator, sorted(xlsx_files)))
+
+    logging.info("\n" + "="*60)
+    logging.info("批量处理完成! 成功处理 %d/%d 个文件", total_processed, len(xlsx_files))
+    logging.info("日志已保存到: %s", log_filepath)
+    logging.info("="*60 + "\n")
+    _flush_logs()
 
-    logging.info(f"\n{'='*60}")
-    logging.info(f"批量处理完成! 成功处理 {total_processed}/{len(xlsx_files)} 个文件")
-    logging.info(f"日志已保存到: {log_filepath}")
-    logging.info(f"{'='*60}\n")
 
 def main():
     """主函数"""
-    import sys
-
-    # 检查命令行参数
-    if len(sys.argv) < 2:
-        # 没有参数时，批量处理resources目录中的所有文件
-        process_all_resources()
-        return
+    try:
+        # 检查命令行参数
+        if len(sys.argv) < 2:
+            # 没有参数时，批量处理resources目录中的所有文件
+            process_all_resources()
+            return
 
-    # 有参数时，处理指定文件
-    # 初始化日志系统
-    log_filepath = setup_logging()
-    logging.info("="*60)
-    logging.info("考题生成系统启动 - 单文件处理模式")
-    logging.info(f"日志文件: {log_filepath}")
-    logging.info("="*60)
-    sys.stdout.flush()
+        # 有参数时，处理指定文件
+        # 初始化日志系统
+        log_filepath = setup_logging()
+        logging.info("="*60)
+        logging.info("考题生成系统启动 - 单文件处理模式")
+        logging.info("日志文件: %s", log_filepath)
+        logging.info("="*60)
 
-    input_file = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else None
+        input_file = sys.argv[1]
+        output_dir = sys.argv[2] if len(sys.argv) > 2 else None
 
-    # 创建生成器并处理文件
-    try:
-        generator = QuestionGenerator()
-        generator.process_file(input_file, output_dir)
-    except ValueError as e:
-        logging.error(f"❌ 初始化失败: {e}")
-        logging.error("请确保在.env文件中设置了DASHSCOPE_API_KEY")
-        sys.stdout.flush()
-        return
+        # 创建生成器并处理文件
+        try:
+            generator = QuestionGenerator()
+            generator.process_file(input_file, output_dir)
+        except ValueError as e:
+            logging.error(f"❌ 初始化失败: {e}")
+            logging.error("请检查.env文件中的DASHSCOPE_API_KEY、DASHSCOPE_RPM、DASHSCOPE_TPM、DASHSCOPE_CONCURRENCY等配置")
+            _flush_logs()
+            return
 
-    logging.info(f"\n{'='*60}")
-    logging.info("处理完成!")
-    logging.info(f"日志已保存到: {log_filepath}")
-    logging.info(f"{'='*60}\n")
+        logging.info("\n" + "="*60)
+        logging.info("处理完成!")
+        logging.info("日志已保存到: %s", log_filepath)
+        logging.info("="*60 + "\n")
+    finally:
+        # 写出缓冲中的日志
+        logging.shutdown()
 
 
 if __name__ == "__main__":
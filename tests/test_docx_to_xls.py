@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""docx_to_xls 的回归测试"""
+
+import os
+import sys
+
+from docx import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx_to_xls import DocxToXlsConverter
+
+
+def _build_docx(path):
+    """生成含制表符分隔元数据行、段内换行的考题文档"""
+    doc = Document()
+    doc.add_paragraph("A-B-A-001  B  3  5")
+    doc.add_paragraph("{A}第一题题干")
+    for key in "ABCD":
+        doc.add_paragraph(f"（{key}）选项{key}")
+    doc.add_paragraph("{B}A")
+    doc.add_paragraph("")
+    # 在Word中用Tab键分隔的元数据行：A-B-A-002<Tab>C<Tab>3<Tab>5
+    doc.add_paragraph("A-B-A-002\tC\t3\t5")
+    doc.add_paragraph("{A}第二题\n题干")
+    doc.add_paragraph("{B}正确")
+    doc.save(path)
+    return doc
+
+
+def test_paragraph_text_matches_python_docx(tmp_path):
+    path = str(tmp_path / "A-B-A-001.docx")
+    doc = _build_docx(path)
+
+    texts = list(DocxToXlsConverter().iter_paragraph_texts(path))
+
+    assert texts == [p.text for p in doc.paragraphs]
+
+
+def test_tab_separated_meta_line(tmp_path):
+    path = str(tmp_path / "A-B-A-001.docx")
+    _build_docx(path)
+
+    questions = DocxToXlsConverter().parse_docx(path)
+
+    assert [q[0] for q in questions] == ["A-B-A-001", "A-B-A-002"]
+    assert questions[0][2] == "第一题题干"
+    assert questions[0][8] == "A"
+    assert questions[1][1] == "C"
+    assert questions[1][2] == "第二题\n题干"
+    assert questions[1][8] == "正确"